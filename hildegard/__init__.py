@@ -1,3 +1,10 @@
 # Copyright (c) 2020 Jeffrey A. Webb
 
-from .ui.qt.common import GUI_Environment as Environment
+# The GUI is imported when Environment is first used, so that tools
+# working on the model (hildegard.diagram, wumps) start without Qt.
+
+def __getattr__(name):
+    if name == "Environment":
+        from .ui.qt.common import GUI_Environment
+        return GUI_Environment
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
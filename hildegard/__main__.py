@@ -1,7 +1,6 @@
 # Copyright (c) 2020 Jeffrey A. Webb
 
 from hildegard.diagram import Diagram
-from hildegard import Environment
 
 import argparse
 import sys
@@ -17,11 +16,52 @@ def create_parser():
     )
     return parser
 
+def create_export_parser():
+    from hildegard.common import export_formats
+    parser = argparse.ArgumentParser(
+        prog="hildegard export",
+        description="Export every diagram of a project without the GUI.")
+    parser.add_argument(
+        "input_file",
+        metavar="FILE",
+        help="Project to export",
+    )
+    parser.add_argument(
+        "-o", "--output",
+        default=".",
+        help="Directory for the exported files",
+    )
+    parser.add_argument(
+        "-f", "--format",
+        action="append",
+        choices=export_formats,
+        help="Format to export, may be repeated (default: svg)",
+    )
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=None,
+        help="Worker processes (default: one per CPU)",
+    )
+    return parser
+
+def export_main(argv):
+    args = create_export_parser().parse_args(argv)
+    from hildegard.ui.qt import export # Imports the GUI
+    written = export.export_project(
+        args.input_file, args.output, formats=args.format or ["svg"],
+        jobs=args.jobs)
+    print(f"exported {len(written)} files")
+    return 0
+
 def main(argv=None):
     global env # must be global to keep program from hanging on exit
 
     if argv is None:
         argv = sys.argv[1:]
+
+    if argv[:1] == ["export"]:
+        return export_main(argv[1:])
         
     parser = create_parser()
     args = parser.parse_args(argv)
@@ -30,10 +70,11 @@ def main(argv=None):
         source = args.input_file
     else:
         source = [Diagram(name="Untitled")]
+
+    from hildegard import Environment # Imports the GUI
         
     env = Environment(source)
-    for entity in env.entities():
-        env.view(entity)
+    env.view_opened()
         
     return env.execute()
 
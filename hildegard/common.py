@@ -1,24 +1,45 @@
 # Copyright (c) 2020 Jeffrey A. Webb
 
+import os
+import tempfile
+
 import wumps
 from wumps import Attribute, Entity
 
+# Formats the diagrams of a project can be exported to
+export_formats = ("svg", "png", "pdf")
+
 class View(Entity):
     _attributes = (
-        Attribute("subject", save=False), # Remove save=False later
+        Attribute("subject", save=False, # Remove save=False later
+                  indexed=True),
         Attribute("widget", save=False),
     )
-    def __init__(self, *args, **kw):
-        super().__init__(self, *args, **kw)
+    def _post_init(self):
         if not self.name and self.subject:
-            self.name = self.subject.name
+            # Part of construction, so not a change
+            self._init_setters["name"](self, self.subject.name)
      
 class Environment:
     _viewers = {}
+    _extension_formats = {
+        ".hp": "yaml",
+        ".hpb": "binary",
+        ".hpd": "directory",
+    }
+    _incremental = False # Save changes to a journal when possible
+    _forking = True # Whether worker processes may be forked
     
     def __init__(self, source, show=True):
         self._entities = []
         self._file_name = None
+        self._file_format = "yaml"
+        self._journal = None
+        self._directory = None
+        self._ids = wumps.Id_Table() # Kept from load to save
+        self._snapshots = wumps.Snapshots() # Shared between saves
+        self._recovery_file = None # Written by _write_recovery()
+        self._recovered = False # Whether unsaved changes were restored
         self._open_entities = []
         if isinstance(source, str):
             self._open(source)
@@ -27,6 +48,10 @@ class Environment:
 
     def entities(self):
         return list(self._entities)
+
+    def entity_by_id(self, number):
+        # The entity saved with the given reference id, or None
+        return self._ids.get(number)
     
     def viewing(self, entity=None):
         if entity is None:
@@ -43,37 +68,224 @@ class Environment:
         if not ret:
             return
         self._file_name = None
+        self._close_trackers()
+        self._ids = wumps.Id_Table()
+        self._snapshots.close()
+        self._recovered = False
         d = Diagram(name="Untitled")
         self._entities = [d]
         self.view(d)
         
     def open(self, file_name):
         ret = self._open(file_name)
-        for entity in self._entities:
-            self.view(entity)
+        self.view_opened()
         return ret
+
+    def viewable(self, entity):
+        # Known without decoding entities that are loaded lazily
+        if isinstance(entity, wumps.Lazy_Entity):
+            return entity.entity_type in self._viewers
+        return type(entity) in self._viewers
+
+    def view_first(self):
+        # Views the first viewable entity.  The others are viewed, and
+        # decoded if they are loaded lazily, when they are opened.
+        for entity in self._entities:
+            if self.viewable(entity):
+                return self.view(entity)
+        return False
+
+    def view_opened(self):
+        # Views the entities of the project.  Only the first is viewed
+        # if it was loaded lazily, so that the others are decoded when
+        # they are opened.
+        if any(isinstance(e, wumps.Lazy_Entity) for e in self._entities):
+            return self.view_first()
+        for entity in self._entities:
+            if self.viewable(entity):
+                self.view(entity)
     
-    def _open(self, file_name): # Not overloaded
+    def _entity_map(self):
         from hildegard import diagram
         from pidgen import component
+        return {
+            "Diagram": diagram.Diagram,
+            "Block": diagram.Block,
+            "Connector": diagram.Connector,
+            "Connection": diagram.Connection,
+            "Endpoint": diagram.Endpoint,
+            "Port": component.Port,
+            "Interface": component.Interface,
+            "Implementation": component.Implementation,
+            "Instance": component.Instance,
+            "Channel": component.Channel,
+            "Hierarchy": component.Hierarchy,
+        }
+
+    def _project_directory(self, file_name):
+        return wumps.Project_Directory(
+            file_name, self._entity_map(), ids=self._ids, fork=self._forking)
+    
+    def _open(self, file_name): # Not overloaded
         ret = self.close_all()
         if not ret:
             return
         print(f"opening: {file_name}")
+        self._close_trackers()
         self._file_name = file_name
-        self._entities = wumps.load(
-            file_name,
-            map={
-                "Diagram": diagram.Diagram,
-                "Block": diagram.Block,
-                "Connector": diagram.Connector,
-                "Connection": diagram.Connection,
-                "Endpoint": diagram.Endpoint,
-                "Port": component.Port,
-            }
-        )
+        self._file_format = wumps.file_format(file_name)
+        self._ids = wumps.Id_Table()
+        self._snapshots.close()
+        self._recovered = False
+        stats = {}
+        if self._file_format == "directory":
+            self._directory = self._project_directory(file_name)
+            self._entities = self._directory.load(stats=stats)
+        elif self._incremental:
+            self._journal = wumps.Journal(
+                file_name, self._entity_map(), format=self._file_format,
+                ids=self._ids)
+            self._entities = self._journal.load(
+                stats=stats, lazy=True, recover=lambda journal:
+                self._offer_recovery(journal.recovery_name))
+        else:
+            self._entities = wumps.load(
+                file_name, map=self._entity_map(), stats=stats, lazy=True,
+                ids=self._ids)
+        recovery = self._recovery_name()
+        if os.path.exists(recovery):
+            if (os.path.getmtime(recovery) >= os.path.getmtime(file_name) and
+                self._offer_recovery(recovery)):
+                # Written in full by the next save
+                self._close_trackers()
+                self._ids = wumps.Id_Table()
+                self._entities = wumps.load(
+                    recovery, map=self._entity_map(), ids=self._ids)
+                self._recovered = True
+                self._recovery_file = recovery
+            else:
+                os.remove(recovery)
+        print(f"loaded in {stats['parse_time'] + stats['build_time']:.3f} s "
+              f"(parse: {stats['parse_time']:.3f} s, "
+              f"backend: {stats['backend']})")
+        if stats.get("intern_saved_bytes"):
+            print(f"shared {stats['interned']} repeated values "
+                  f"({stats['intern_saved_bytes']/2**20:.1f} MB)")
+        if stats.get("journal_records"):
+            print(f"replayed {stats['journal_records']} journal records")
+        if stats.get("recovered_records"):
+            print(f"recovered {stats['recovered_records']} unsaved changes")
+
+    def _offer_recovery(self, file_name):
+        # Called when unsaved changes from an earlier session are found
+        print(f"restoring unsaved changes from: {file_name}")
+        return True
+
+    def _recovery_name(self):
+        # The whole project is written here when its changes can not be
+        # recorded by the journal: next to the project file, or in the
+        # temporary directory if it is untitled
+        if self._file_name is None:
+            return os.path.join(
+                tempfile.gettempdir(), f"hildegard-{os.getpid()}.recovery")
+        return self._file_name + ".snapshot.recovery"
+
+    def _write_recovery(self):
+        # Records the unsaved changes, so that they can be restored
+        # after a crash.  Returns True if anything was written.
+        journal = self._journal
+        if journal is not None and journal.recording():
+            return journal.autosave(self._entities)
+        file_name = self._recovery_name()
+        if (self._recovery_file not in (None, file_name) and
+            os.path.exists(self._recovery_file)):
+            # Written before the project was saved under a new name
+            os.remove(self._recovery_file)
+        ids = wumps.Id_Table()
+        snapshot = self._snapshots.take(self._entities, self._ids, ids)
+        wumps.save(snapshot, file_name=file_name, format="binary", ids=ids)
+        self._recovery_file = file_name
+        return True
+
+    def _discard_recovery(self):
+        if self._journal is not None:
+            self._journal.discard_recovery()
+        if self._recovery_file is not None:
+            if os.path.exists(self._recovery_file):
+                os.remove(self._recovery_file)
+            self._recovery_file = None
+
+    def _close_trackers(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        if self._directory is not None:
+            self._directory.close()
+            self._directory = None
+        
+    def _prepare_save(self):
+        # Returns a function that writes the project file from a
+        # snapshot and can run in another thread, or None if the changes
+        # have already been saved to the journal.
+        format = self._save_format(self._file_name)
+        file_name = self._file_name
+        if format == "directory":
+            # Only the changed files are written, in parallel
+            directory = self._directory
+            if directory is None or directory.directory != file_name:
+                self._close_trackers()
+                directory = self._directory = self._project_directory(
+                    file_name)
+            return directory.prepare_save(self._entities)
+        journal = self._journal
+        if (journal is not None and journal.file_name == file_name and
+            journal.format == format):
+            if not journal.needs_compaction():
+                journal.save(self._entities)
+                return None
+        else:
+            self._close_trackers()
+            if self._incremental:
+                journal = self._journal = wumps.Journal(
+                    file_name, self._entity_map(), format=format,
+                    ids=self._ids)
+        if journal is not None:
+            snapshot = journal.snapshot(self._entities)
+            return lambda progress=None: journal.write(
+                snapshot, progress=progress)
+        ids = wumps.Id_Table()
+        snapshot = self._snapshots.take(self._entities, self._ids, ids)
+        return lambda progress=None: wumps.save(
+            snapshot, file_name=file_name, format=format, progress=progress,
+            ids=ids)
+
+    def _save(self):
+        write = self._prepare_save()
+        if write is not None:
+            write()
+        self._discard_recovery()
+        
+    def _save_format(self, file_name):
+        # Known extensions select the format, otherwise the format of
+        # the opened file is kept.
+        for extension, format in self._extension_formats.items():
+            if file_name.endswith(extension):
+                return format
+        return self._file_format
+        
+    def _resolve(self, entity):
+        # Lazily loaded entities are replaced by the real ones when
+        # they are first viewed.
+        if isinstance(entity, wumps.Lazy_Entity):
+            resolved = entity.resolve()
+            for i, e in enumerate(self._entities):
+                if e is entity:
+                    self._entities[i] = resolved
+            return resolved
+        return entity
         
     def view(self, entity, show=True):
+        entity = self._resolve(entity)
         if not entity in self._entities:
             print("error: tried to view external entitiy")
             return False
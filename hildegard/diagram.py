@@ -2,7 +2,10 @@
 
 from .common import View
 from pidgen import component
-from wumps import Attribute, Entity, elements
+from wumps import Attribute, Entity, elements, migration, owner, referrers
+from wumps.migrations import keyed
+
+import yaml
 
 class Connector(View):
     _attributes = (
@@ -13,37 +16,95 @@ class Connector(View):
 
 class Endpoint(Entity):
     _attributes = (
-        Attribute("connector", Connector, reference=True),
+        Attribute("connector", Connector, reference=True, indexed=True),
         Attribute("ports",
                   elements(component.Port, "port", anonymous=True)),
     )
 
 class Symbol(View):
+    __slots__ = ("_geometry",) # Geometry_Table holding a row for it
     _attributes = (
         Attribute("subject", component.Instance, alias="instance"),
         Attribute("connectors",
-                  elements(Connector, "connector", anonymous=True)),
-        Attribute("x", float),
-        Attribute("y", float),
+                  elements(Connector, "connector", anonymous=True),
+                  indexed=True),
+        Attribute("x", float, notify=True),
+        Attribute("y", float, notify=True),
     )
 
+    def _notify(self, name, value):
+        table = getattr(self, "_geometry", None)
+        if table is not None:
+            table._set(self, name, value)
+
 class Block(Symbol):
     _attributes = (
-        Attribute("width", float),
-        Attribute("height", float),
+        Attribute("width", float, notify=True),
+        Attribute("height", float, notify=True),
     )
 
 class Connection(View):
     _attributes = (
         Attribute("subject", component.Channel, alias="channel"),
-        Attribute("source", Endpoint),
-        Attribute("sink", Endpoint),
+        Attribute("source", Endpoint, indexed=True),
+        Attribute("sink", Endpoint, indexed=True),
     )
 
 class Diagram(View):
+    __slots__ = ("_geometry",)
     _attributes = (
         Attribute("subject", component.Hierarchy, alias="hierarchy"),
-        Attribute("symbols", elements(Symbol, "symbol", anonymous=True)),
+        Attribute("symbols", elements(Symbol, "symbol", anonymous=True),
+                  indexed=True),
         Attribute("connections",
-                  elements(Connection, "connection", anonymous=True)),
+                  elements(Connection, "connection", anonymous=True),
+                  indexed=True),
     )
+
+    def remove_symbol(self, symbol):
+        # Also removes the connections to its connectors
+        for connector in symbol.connectors:
+            for connection in connections_of(connector):
+                if owner(connection) == (self, "connections"):
+                    self.connections.remove(connection)
+        self.symbols.remove(symbol)
+
+    def geometry(self):
+        # The Geometry_Table of the symbols, which needs NumPy
+        table = getattr(self, "_geometry", None)
+        if table is None:
+            from .geometry import Geometry_Table
+            table = self._geometry = Geometry_Table(self)
+        return table
+
+def connections_of(connector):
+    # The connections in diagrams with an endpoint at connector
+    connections = {}
+    for endpoint in referrers(connector, "connector"):
+        held_by = owner(endpoint)
+        if held_by is not None and owner(held_by[0]) is not None:
+            connections[held_by[0]] = None
+    return list(connections)
+
+def views_of(subject):
+    # The connectors, blocks, connections and diagrams showing subject
+    return referrers(subject, "subject")
+
+@migration((0, 0), (0, 1))
+def _add_endpoints(events):
+    # The source and sink of a connection were references to
+    # connectors, and are now endpoints holding the reference
+    for parent, key, event in keyed(events):
+        if (parent == "Connection" and key in ("source", "sink") and
+            isinstance(event, yaml.ScalarEvent) and event.value):
+            yield yaml.SequenceStartEvent(None, None, True, flow_style=False)
+            yield yaml.MappingStartEvent(None, None, True, flow_style=False)
+            yield yaml.ScalarEvent(None, None, (True, False), "Endpoint")
+            yield yaml.MappingStartEvent(None, None, True, flow_style=False)
+            yield yaml.ScalarEvent(None, None, (True, False), "connector")
+            yield event
+            yield yaml.MappingEndEvent()
+            yield yaml.MappingEndEvent()
+            yield yaml.SequenceEndEvent()
+        else:
+            yield event
@@ -0,0 +1,111 @@
+# Copyright (c) 2020 Jeffrey A. Webb
+
+# Positions and sizes of the symbols of a diagram as NumPy arrays, one
+# column per symbol, so that whole-diagram queries are vectorized.
+# Assignments to the geometry attributes of the symbols are written
+# through to the table, and bulk changes made through the table are
+# assigned to the attributes, which remain what is saved.
+
+try:
+    import numpy
+except ImportError: # Geometry tables are optional
+    numpy = None
+
+_rows = {"x": 0, "y": 1, "width": 2, "height": 3}
+
+def _float(value):
+    return 0.0 if value is None else value
+
+class Geometry_Table:
+    def __init__(self, diagram):
+        if numpy is None:
+            raise ImportError("geometry tables require NumPy")
+        self.diagram = diagram
+        self._symbols = []
+        self._columns = {}
+        self._data = numpy.zeros((4, 0))
+
+    # Rows of the table, indexed by the position of each symbol in
+    # self.symbols(), which are views valid until the symbols change
+    @property
+    def x(self):
+        return self._update()[0]
+
+    @property
+    def y(self):
+        return self._update()[1]
+
+    @property
+    def width(self):
+        return self._update()[2]
+
+    @property
+    def height(self):
+        return self._update()[3]
+
+    def symbols(self):
+        self._update()
+        return list(self._symbols)
+
+    def _update(self):
+        # Follows additions, removals and reordering of the symbols
+        symbols = self.diagram.symbols
+        if self._symbols != symbols:
+            for symbol in self._symbols:
+                if getattr(symbol, "_geometry", None) is self:
+                    symbol._geometry = None
+            self._symbols = list(symbols)
+            self._columns = {s: i for i, s in enumerate(self._symbols)}
+            self._data = numpy.array(
+                [[_float(s.x) for s in self._symbols],
+                 [_float(s.y) for s in self._symbols],
+                 [_float(getattr(s, "width", None)) for s in self._symbols],
+                 [_float(getattr(s, "height", None)) for s in self._symbols]],
+                dtype=float).reshape(4, len(self._symbols))
+            for symbol in self._symbols:
+                symbol._geometry = self
+        return self._data
+
+    def _set(self, symbol, name, value):
+        column = self._columns.get(symbol)
+        if column is not None:
+            self._data[_rows[name], column] = _float(value)
+
+    def extents(self):
+        # (x0, y0, x1, y1) enclosing all symbols, or None if there are
+        # none
+        x, y, width, height = self._update()
+        if not len(x):
+            return None
+        return (float(x.min()), float(y.min()),
+                float((x + width).max()), float((y + height).max()))
+
+    def _hits(self, x0, y0, x1, y1):
+        x, y, width, height = self._update()
+        return (x < x1) & (x + width > x0) & (y < y1) & (y + height > y0)
+
+    def hit(self, x0, y0, x1, y1):
+        # The symbols overlapping the given rectangle
+        return [self._symbols[i] for i in
+                numpy.flatnonzero(self._hits(x0, y0, x1, y1))]
+
+    def overlapping(self, symbol):
+        # The other symbols overlapping symbol
+        hits = self._hits(symbol.x, symbol.y,
+                          symbol.x + _float(getattr(symbol, "width", None)),
+                          symbol.y + _float(getattr(symbol, "height", None)))
+        column = self._columns.get(symbol)
+        if column is not None:
+            hits[column] = False
+        return [self._symbols[i] for i in numpy.flatnonzero(hits)]
+
+    def translate(self, symbols, dx, dy):
+        # Moves the given symbols of the diagram
+        data = self._update()
+        columns = numpy.fromiter(
+            (self._columns[s] for s in symbols), dtype=numpy.intp)
+        xs = (data[0, columns] + dx).tolist()
+        ys = (data[1, columns] + dy).tolist()
+        for symbol, x, y in zip(symbols, xs, ys):
+            symbol.x = x
+            symbol.y = y
@@ -5,7 +5,7 @@ from ...diagram import Block, Diagram
 from ...common import Environment
 import wumps
 
-from qtpy.QtCore import Qt
+from qtpy.QtCore import QThread, QTimer, Qt, Signal
 from qtpy.QtGui import QIcon
 from qtpy.QtWidgets import (
     QAction, QApplication, QFileDialog,  QGraphicsItem, QMainWindow,
@@ -43,6 +43,11 @@ class Main_Window(QMainWindow):
         open_action.triggered.connect(lambda: env.open())
         project_menu.addAction(open_action)
 
+        view_menu = project_menu.addMenu("&View")
+        view_menu.setStatusTip("Open a diagram of the project in a tab")
+        view_menu.aboutToShow.connect(
+            lambda: self._update_view_menu(view_menu))
+
         save_action = QAction("&Save", self)
         self.save_action = save_action
         save_action.setShortcut("Ctrl+S")
@@ -65,6 +70,26 @@ class Main_Window(QMainWindow):
         quit_action.setStatusTip("Quit Hildegard")
         quit_action.triggered.connect(self.handle_quit)
         project_menu.addAction(quit_action)
+
+        edit_menu = main_menu.addMenu("&Edit")
+
+        undo_action = QAction("&Undo", self)
+        self.undo_action = undo_action
+        undo_action.setShortcut("Ctrl+Z")
+        undo_action.setIcon(QIcon.fromTheme("edit-undo"))
+        undo_action.setStatusTip("Undo the last change")
+        undo_action.setEnabled(False)
+        undo_action.triggered.connect(lambda: env.undo())
+        edit_menu.addAction(undo_action)
+
+        redo_action = QAction("&Redo", self)
+        self.redo_action = redo_action
+        redo_action.setShortcuts(["Ctrl+Shift+Z", "Ctrl+Y"])
+        redo_action.setIcon(QIcon.fromTheme("edit-redo"))
+        redo_action.setStatusTip("Redo the last undone change")
+        redo_action.setEnabled(False)
+        redo_action.triggered.connect(lambda: env.redo())
+        edit_menu.addAction(redo_action)
         
         self.tabs = QTabWidget()
         self.tabs.setTabsClosable(True)
@@ -91,6 +116,22 @@ class Main_Window(QMainWindow):
                     self.toolbar.addAction(t)
                     self._extra_toolbar_actions.append(t)
                     
+    def _update_view_menu(self, menu):
+        # Lists the entities that can be viewed, which are only decoded
+        # when chosen if they are loaded lazily
+        menu.clear()
+        for entity in self._env.entities():
+            if self._env.viewable(entity):
+                action = menu.addAction(entity.name or "Untitled")
+                action.triggered.connect(
+                    lambda checked=False, e=entity: self._show_entity(e))
+
+    def _show_entity(self, entity):
+        self._env.view(entity)
+        entity = self._env._resolve(entity)
+        if entity.widget is not None:
+            self.tabs.setCurrentWidget(entity.widget)
+
     def handle_quit(self):
         if self._env._ok_to_quit():
             qApp.quit()
@@ -109,6 +150,15 @@ class Main_Window(QMainWindow):
             modified_str = "*"
         self.setWindowTitle(f"Hildegard: {base_name}{modified_str}")
 
+    def update_undo_actions(self):
+        undo = self._env._undo
+        label = undo.undo_label()
+        self.undo_action.setEnabled(undo.can_undo())
+        self.undo_action.setText(f"&Undo {label}" if label else "&Undo")
+        label = undo.redo_label()
+        self.redo_action.setEnabled(undo.can_redo())
+        self.redo_action.setText(f"&Redo {label}" if label else "&Redo")
+
     def update_tab_title(self, index):
         modified_str = ""
         widget = self.tabs.widget(index)
@@ -117,21 +167,57 @@ class Main_Window(QMainWindow):
         self.tabs.setTabText(
             index, f"{widget.entity.name}{modified_str}")
         
+class Save_Thread(QThread):
+    progress = Signal(int)
+
+    def __init__(self, write, file_name, parent=None):
+        super().__init__(parent)
+        self._write = write
+        self.file_name = file_name
+        self.error = None
+
+    def run(self):
+        try:
+            self._write(progress=self._report)
+        except Exception as e:
+            self.error = e
+
+    def _report(self, done, total):
+        self.progress.emit(int(100*done/total) if total else 100)
+        
 class GUI_Environment(Environment):
     _viewers = {
         Diagram: diagram.Diagram_Editor,
         Block: diagram.Block_Editor,
     }
+    _incremental = True
+    _forking = False # Qt does not survive fork()
+    _autosave_interval = 2000 # ms after the first unrecorded change
     
     def __init__(self, source, show=True):
+        # Created first so that opening the project can show dialogs
+        self._app = QApplication([])
+        self._app.setAttribute(Qt.AA_DontShowIconsInMenus, True)
+        # Model changes are delivered once per event loop iteration
+        self._changes = wumps.Change_Bus(
+            schedule=lambda flush: QTimer.singleShot(0, flush))
+        self._changes.subscribe(self._model_changed)
+        self._undo = wumps.Undo_Stack()
         super().__init__(source, show=show)
+        self._changes.attach(self._entities)
+        self._undo.attach(self._entities)
         self.modified = False
         self.modified_widgets = set()
-        self._app = QApplication([])
-        self._app.setAttribute(Qt.AA_DontShowIconsInMenus, True)
+        self._save_thread = None
+        self._save_pending = False
+        self._autosave_timer = QTimer()
+        self._autosave_timer.setSingleShot(True)
+        self._autosave_timer.setInterval(self._autosave_interval)
+        self._autosave_timer.timeout.connect(self._autosave)
         self._main_window = Main_Window(self)
         if show:
             self._main_window.show()
+        self._check_recovered()
         
     def execute(self):
         return self._app.exec_()
@@ -179,6 +265,9 @@ class GUI_Environment(Environment):
                 saved = self.save()
                 if not saved:
                     return False
+            else:
+                self._discard_recovery()
+        self._wait_for_save()
         return True
 
     def new(self):
@@ -188,7 +277,11 @@ class GUI_Environment(Environment):
         ret = self.close_all()
         if not ret:
             return
+        self._undo.close()
         super().new()
+        self._changes.attach(self._entities)
+        self._undo.attach(self._entities)
+        self._main_window.update_undo_actions()
         
     def open(self, file_name=None):
         if not self._ok_to_quit():
@@ -196,7 +289,10 @@ class GUI_Environment(Environment):
         if not file_name:
             file_name, selected_filter = QFileDialog.getOpenFileName(
                 self._main_window, caption="Open File",
-                filter="Hildegard Project Files (*.hp)")
+                filter="Hildegard Project Files (*.hp *.hpb index.yaml)")
+            if os.path.basename(file_name) == wumps.directory.index_name:
+                # Project directories are opened through their index
+                file_name = os.path.dirname(file_name)
             if file_name:
                 self.clear_modified()
                 ret = self.close_all()
@@ -204,12 +300,41 @@ class GUI_Environment(Environment):
                     return
                 self._file_name = file_name
                 self._main_window.update_title()
+                self._changes.close() # Loading is not a change
+                self._undo.close()
                 super().open(file_name)
+                self._changes.attach(self._entities)
+                self._undo.attach(self._entities)
+                self._main_window.update_undo_actions()
+                self._check_recovered()
+
+    def _offer_recovery(self, file_name):
+        mb = QMessageBox()
+        mb.setText("Unsaved changes to this project were found.")
+        mb.setInformativeText("Do you want to restore them?")
+        mb.setStandardButtons(QMessageBox.Yes | QMessageBox.Discard)
+        mb.setDefaultButton(QMessageBox.Yes)
+        return mb.exec() == QMessageBox.Yes
+
+    def _check_recovered(self):
+        if self._recovered or (
+                self._journal is not None and self._journal.modified()):
+            self.set_modified()
             
     def view(self, entity, show=True):
-        added = super().view(entity, show=show)
+        entity = self._resolve(entity)
+        # Setting up the editor writes the model, which is not a change
+        self._changes.flush()
+        with self._undo.ignoring():
+            added = super().view(entity, show=show)
+        self._changes.discard()
         if not added:
             return False
+        widget = entity.widget
+        widget.scene_item.undo_stack = self._undo
+        widget.subscription = self._changes.subscribe(
+            lambda changes: self._view_changed(widget, changes),
+            entities=widget.scene_item.entities)
         self._add_tab(entity)
         if show:
             entity.widget.show()
@@ -221,6 +346,7 @@ class GUI_Environment(Environment):
         if not self._ok_to_close(entity):
             return False
         self._remove_tab(entity)
+        self._changes.unsubscribe(entity.widget.subscription)
         entity.widget.close()
         ret = super().close(entity)
         if not self.viewing() and quit:
@@ -236,7 +362,9 @@ class GUI_Environment(Environment):
     def _set_new_file_name(self):
         file_name, selected_filter = QFileDialog.getSaveFileName(
             self._main_window, caption="Save Environment",
-            filter="Hildegard Project Files (*.hp)")
+            filter="Hildegard Project Files (*.hp);;"
+            "Hildegard Binary Project Files (*.hpb);;"
+            "Hildegard Project Directories (*.hpd)")
         if file_name:
             self._file_name = file_name
             self._main_window.update_title()
@@ -249,11 +377,63 @@ class GUI_Environment(Environment):
     def save(self):
         if not self._file_name:
             self._set_new_file_name()
-        if self._file_name:
-            wumps.save(self._entities, file_name=self._file_name)
-            self._main_window.save_action.setEnabled(False)
-            self.clear_modified()
-        return True if self._file_name else False
+        if not self._file_name:
+            return False
+        if self._save_thread is not None:
+            # Saves the model as it is once the running save is done
+            self._save_pending = True
+            return True
+        write = self._prepare_save()
+        self._main_window.save_action.setEnabled(False)
+        self.clear_modified()
+        if write is not None:
+            self._start_save(write)
+        else:
+            self._discard_recovery()
+            self._main_window.statusBar().showMessage(
+                f"Saved {os.path.basename(self._file_name)}", 5000)
+        return True
+
+    def _start_save(self, write):
+        status_bar = self._main_window.statusBar()
+        base_name = os.path.basename(self._file_name)
+        status_bar.showMessage(f"Saving {base_name}...")
+        thread = Save_Thread(write, self._file_name, self._main_window)
+        thread.progress.connect(
+            lambda percent: status_bar.showMessage(
+                f"Saving {base_name}... {percent}%"))
+        thread.finished.connect(lambda: self._save_finished(thread))
+        self._save_thread = thread
+        thread.start()
+
+    def _save_finished(self, thread):
+        if thread is not self._save_thread:
+            return # Already handled by _wait_for_save()
+        self._save_thread = None
+        status_bar = self._main_window.statusBar()
+        if thread.error is not None:
+            # The project file was left as it was, so the journal no
+            # longer matches it
+            self._close_trackers()
+            status_bar.showMessage("Save failed", 5000)
+            self.set_modified()
+            QMessageBox.critical(
+                self._main_window, "Save Failed",
+                f"The project could not be saved:\n{thread.error}")
+        else:
+            self._discard_recovery()
+            status_bar.showMessage(
+                f"Saved {os.path.basename(thread.file_name)}", 5000)
+        if self._save_pending:
+            self._save_pending = False
+            if self.modified:
+                self.save()
+
+    def _wait_for_save(self):
+        # Finishes the running save and any save queued behind it
+        while self._save_thread is not None:
+            self._save_thread.wait()
+            self._save_finished(self._save_thread)
         
     def set_modified(self, subitem=None):
         if subitem is not None:
@@ -266,6 +446,53 @@ class GUI_Environment(Environment):
         self.modified = True
         self._main_window.update_title()
         self._main_window.save_action.setEnabled(True)
+        if not self._autosave_timer.isActive():
+            self._autosave_timer.start()
+
+    def _model_changed(self, changes):
+        self.set_modified()
+        self._main_window.update_undo_actions()
+
+    def _view_changed(self, widget, changes):
+        self.set_modified(widget)
+        # Changes made elsewhere, such as by undo, are shown
+        with self._undo.ignoring():
+            if widget.scene_item.update_from_model(changes):
+                return
+        self._reopen(widget.entity)
+
+    def _reopen(self, entity):
+        # Rebuilds the editor of entity, in the same tab position
+        widget = entity.widget
+        tabs = self._main_window.tabs
+        index = tabs.indexOf(widget)
+        modified = widget in self.modified_widgets
+        self._remove_tab(entity)
+        self._changes.unsubscribe(widget.subscription)
+        widget.close()
+        self.modified_widgets.discard(widget)
+        super().close(entity)
+        self.view(entity)
+        tabs.tabBar().moveTab(tabs.indexOf(entity.widget), index)
+        tabs.setCurrentWidget(entity.widget)
+        if modified:
+            self.set_modified(entity.widget)
+
+    def undo(self):
+        self._undo.undo()
+        self._main_window.update_undo_actions()
+
+    def redo(self):
+        self._undo.redo()
+        self._main_window.update_undo_actions()
+
+    def _autosave(self):
+        # Records the changes made since the last save or autosave in
+        # the recovery file
+        if self._save_thread is not None:
+            self._autosave_timer.start() # Keys change when it finishes
+            return
+        self._write_recovery()
         
     def clear_modified(self):
         self.modified = False
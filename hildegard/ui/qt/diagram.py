@@ -4,6 +4,7 @@ from . import receptor
 from . import scene
 from . import resizer
 from ... import diagram
+from wumps import owner
 
 import adaptagrams as avoid
 
@@ -65,9 +66,10 @@ class Connector_Title(Title):
         super().focusOutEvent(event)
         if not self.toPlainText():
             connector_item = self.parentItem()
-            self.setParentItem(None)
-            connector_item.parentItem().parentItem().remove_connector(
-                connector_item)
+            with scene.command(connector_item, "Delete"):
+                self.setParentItem(None)
+                connector_item.parentItem().parentItem().remove_connector(
+                    connector_item)
         
     def _stop_editing(self):
         self.parentItem().setFocus()
@@ -126,12 +128,14 @@ class Connector_Item(QGraphicsRectItem):
     def keyPressEvent(self, event):
         key = event.key()
         if (key == Qt.Key_Delete):
-            self.parentItem().parentItem().remove_connector(self)
+            with scene.command(self, "Delete"):
+                self.parentItem().parentItem().remove_connector(self)
         elif (key == key == Qt.Key_E):
             self._title.start_editing()
         elif (key == key == Qt.Key_N):
-            self.parentItem().parentItem().append_new_connector(
-                after=self, edit=True)
+            with scene.command(self, "Add connector"):
+                self.parentItem().parentItem().append_new_connector(
+                    after=self, edit=True)
             return
         super().keyPressEvent(event)
         
@@ -145,6 +149,10 @@ class Connector_Item(QGraphicsRectItem):
         if ((self.flags() & self.ItemIsMovable) and
             event.button() == Qt.LeftButton):
             self._moved_since_click = False
+            # The rows shifted by the move are one change
+            stack = scene.undo_stack(self)
+            if stack is not None:
+                stack.begin_gesture("Move connector")
             self.parentItem().parentItem().handle_connector_start_move(self)
         super().mousePressEvent(event)
 
@@ -163,6 +171,9 @@ class Connector_Item(QGraphicsRectItem):
                 disregard = True
             self.parentItem().parentItem().handle_connector_end_move(
                 self, disregard=disregard)
+            stack = scene.undo_stack(self)
+            if stack is not None:
+                stack.end()
         super().mouseReleaseEvent(event)
 
     def hoverEnterEvent(self, event):
@@ -183,10 +194,12 @@ class Connector_Item(QGraphicsRectItem):
         return x, y
         
 class Block_Item(QGraphicsRectItem):
-    def __init__(self, block, debug=False):
+    def __init__(self, block, debug=False, entities=None):
         self._block = block
         self._debug = debug
-        self.modified_callback = None
+        # Model entities shown, shared with the diagram if given
+        self.entities = set() if entities is None else entities
+        self.entities.add(block)
         
         self._base_zvalue = None
         self._top_zvalue = 1
@@ -323,7 +336,8 @@ class Block_Item(QGraphicsRectItem):
                 self._update_receptor_sensitivities()
                 r, c = self._receptors.get_cell_at(mouse=True, sensitive=True)
                 if r is not None:
-                    new_c = self.add_new_connector_at(r, c, edit=True)
+                    with scene.command(self, "Add connector"):
+                        new_c = self.add_new_connector_at(r, c, edit=True)
                 elif self._title.boundingRect().contains(
                         self._title.mapFromParent(event.pos())):
                     self._title.start_editing()
@@ -368,16 +382,31 @@ class Block_Item(QGraphicsRectItem):
                    self.clearFocus()
         if parent_item:
             parent_item.mouse_pressed_in(self)
+        if event.button() == Qt.LeftButton:
+            # A drag moves all selected blocks as one change
+            stack = scene.undo_stack(self)
+            if stack is not None:
+                stack.begin_gesture("Move")
         super().mousePressEvent(event)
 
+    def mouseReleaseEvent(self, event):
+        super().mouseReleaseEvent(event)
+        if event.button() == Qt.LeftButton:
+            stack = scene.undo_stack(self)
+            if stack is not None:
+                stack.end()
+
     def keyPressEvent(self, event):
         key = event.key()
         if (key == Qt.Key_Delete):
             parent_item = self.parentItem()
             if parent_item:
-                parent_item.remove_block(self)
+                # With its connections
+                with scene.command(self, "Delete"):
+                    parent_item.remove_block(self)
         elif (key == key == Qt.Key_N):
-            self.append_new_connector(edit=True)
+            with scene.command(self, "Add connector"):
+                self.append_new_connector(edit=True)
         super().keyPressEvent(event)
         
     def mouse_pressed_in(self, source_item):
@@ -392,6 +421,7 @@ class Block_Item(QGraphicsRectItem):
         connector.setParentItem(None)
         self._update_geometry()
         self._block.connectors.remove(connector._connector)
+        self.entities.discard(connector._connector)
         
     def add_connector(self, connector, quick=False):
         new_item = Connector_Item(
@@ -402,6 +432,7 @@ class Block_Item(QGraphicsRectItem):
         if not quick:
             self._ensure_minimum_size()
         self._connectors.append(new_item)
+        self.entities.add(connector)
         if not connector in self._block.connectors:
             self._block.connectors.append(connector)
         return new_item
@@ -482,10 +513,6 @@ class Block_Item(QGraphicsRectItem):
             else:
                 c.setAcceptHoverEvents(False)
 
-    def set_modified(self, subitem=None):
-        if self.modified_callback:
-            self.modified_callback(self)
-                    
     def _ensure_minimum_size(self):
         min_width = self._title.boundingRect().width()
         min_height = self._header_height + self._footer_height
@@ -676,7 +703,6 @@ class Block_Item(QGraphicsRectItem):
         self._update_geometry()
 
     def _update_avoid(self):
-        self.set_modified()
         if self.parentItem():
             avoid_router = self.parentItem().avoid_router
             r = self.rect()
@@ -791,6 +817,31 @@ class Block_Item(QGraphicsRectItem):
     def setParentItem(self, parent_item):
         super().setParentItem(parent_item)
         self._update_avoid()
+
+    def update_from_model(self, changes):
+        # Shows changes made to the block elsewhere.  Returns False if
+        # the item has to be rebuilt instead.
+        block = self._block
+        connectors = {c._connector for c in self._connectors}
+        if len(connectors) != len(block.connectors) or any(
+                c not in connectors for c in block.connectors):
+            return False
+        for c in self._connectors:
+            if (c._connector.name or "") != c._title.toPlainText():
+                return False
+        if (block.name or "") != self._title.toPlainText():
+            self._title.setPlainText(block.name or "")
+            self._ensure_minimum_size()
+        if (self.x(), self.y()) != (block.x, block.y):
+            self.setPos(block.x, block.y)
+        r = self.rect()
+        if (r.width(), r.height()) != (block.width, block.height):
+            r.setWidth(block.width)
+            r.setHeight(block.height)
+            self.setRect(r)
+        elif any(c in changes for c in connectors):
+            self._update_geometry()
+        return True
         
 class Connection_Ports_Item(QGraphicsRectItem):
     def __init__(self):
@@ -1051,7 +1102,7 @@ class Diagram_Item(QGraphicsItem):
     def __init__(self, entity):
         super().__init__()
         self.entity = entity
-        self.modified_callback = None
+        self.entities = {entity} # Model entities shown
         self.connection_in_progress_from = None
         self.connection_in_progress_line = None
         self.connect_on_double_click = True
@@ -1066,8 +1117,12 @@ class Diagram_Item(QGraphicsItem):
             avoid.crossingPenalty, 50000000)
         self.route_radius = 6.0
         self.pin_length = 10.0
+        self.undo_stack = None # Set by the environment
+        self._hold_avoid_updates = True # Routed once, when all are added
+        self._avoid_updates_held = False
         self._connection_items = []
         self._block_items = []
+        self._items = {} # block or connection -> item
         for i, s in enumerate(self.entity.symbols):
             w = s.width
             h = s.height
@@ -1080,14 +1135,17 @@ class Diagram_Item(QGraphicsItem):
             s_ui._ensure_minimum_size()
         for c in self.entity.connections:
             self.add_connection(c)
+        self._hold_avoid_updates = False
+        self._avoid_updates_held = False
         self.process_avoid_updates()
 
     def double_clicked_in_background(self, scene_pos):
         # Note that this block should really be associated with
         # some component, but that is not required at this time.
         b = diagram.Block(name="Untitled", width=100, height=100)
-        b_item = self.add_block(b, debug=False)
-        b_item.setPos(b_item.mapFromScene(scene_pos))
+        with scene.command(self, "Add block"):
+            b_item = self.add_block(b, debug=False)
+            b_item.setPos(b_item.mapFromScene(scene_pos))
         b_item.set_editing_mode(True, edit_title=True)
         return True # Do not call mouseDoubleClickEvent, will stop editing
     
@@ -1128,7 +1186,8 @@ class Diagram_Item(QGraphicsItem):
                 sink=sink_ep,
             )
             self._stop_connecting()
-            self.add_connection(conn)
+            with scene.command(self, "Connect"):
+                self.add_connection(conn)
             self.process_avoid_updates()
         else:
             self.abort_connecting(c)
@@ -1153,33 +1212,52 @@ class Diagram_Item(QGraphicsItem):
         c_ui.setParentItem(self)
         c_ui.arrow.setParentItem(self)
         self._connection_items.append(c_ui)
+        self._items[connection] = c_ui
+        self.entities.add(connection)
         self._hide_duplicate_connections()
         if not connection in self.entity.connections:
             self.entity.connections.append(connection)
         return c_ui
 
     def remove_connection(self, c_ui):
+        self._remove_connection_item(c_ui)
+        self.entity.connections.remove(c_ui._connection)
+
+    def _remove_connection_item(self, c_ui):
+        # Leaves the model as it is
         self.avoid_router.deleteConnector(c_ui.avoid_conn)
         self._connection_items.remove(c_ui)
+        del self._items[c_ui._connection]
         c_ui.setParentItem(None)
         c_ui.arrow.setParentItem(None)
         self._hide_duplicate_connections()
-        self.entity.connections.remove(c_ui._connection)
+        self.entities.discard(c_ui._connection)
 
     def add_block(self, block, debug=False):
-        s_ui = Block_Item(block, debug=debug)
-        s_ui.modified_callback = self.set_modified
+        s_ui = Block_Item(block, debug=debug, entities=self.entities)
         s_ui.setParentItem(self)
         self._block_items.append(s_ui)
+        self._items[block] = s_ui
         if not block in self.entity.symbols:
             self.entity.symbols.append(block)
         return s_ui
     
     def remove_block(self, block):
+        # Also removes the connections to its connectors
+        symbol = block._block
+        connections = set()
+        for connector in symbol.connectors:
+            connections.update(diagram.connections_of(connector))
+        for c_ui in list(self._connection_items):
+            if c_ui._connection in connections:
+                self._remove_connection_item(c_ui)
         self._block_items.remove(block)
-        block.remove_all_connectors()
+        del self._items[symbol]
         block.setParentItem(None)
-        self.entity.symbols.remove(block._block)
+        self.entity.remove_symbol(symbol)
+        self.entities.discard(symbol)
+        for connector in symbol.connectors:
+            self.entities.discard(connector)
         
     def mouse_pressed_in(self, source_item):
         # Allow diagram elements to know that the mouse was pressed
@@ -1205,11 +1283,10 @@ class Diagram_Item(QGraphicsItem):
         for c_ui in list(self._connection_items):
             c_ui.set_show_connection_ports_on_hover(show)
             
-    def set_modified(self, subitem=None):
-        if self.modified_callback:
-            self.modified_callback(self)
-                    
     def process_avoid_updates(self):
+        if self._hold_avoid_updates:
+            self._avoid_updates_held = True
+            return
         for c_ui in list(self._connection_items):
             success = c_ui.update_endpoints()
             if not success:
@@ -1217,7 +1294,53 @@ class Diagram_Item(QGraphicsItem):
         self.avoid_router.processTransaction()
         for c_ui in self._connection_items:
             c_ui.update_from_avoid_router()
-        self.set_modified()
+
+    def update_from_model(self, changes):
+        # Shows changes made to the diagram elsewhere, such as by undo,
+        # rerouting once.  Returns False if the item has to be rebuilt
+        # instead.  Only the items of the changed entities are visited.
+        items = self._items
+        blocks = {}
+        for entity, names in changes.items():
+            if entity is self.entity:
+                if ({"symbols", "connections"} & names and
+                    not self._matches_model()):
+                    return False
+                continue
+            item = items.get(entity)
+            if item is None:
+                # A connector, shown by the item of its block
+                held_by = owner(entity)
+                if held_by is None or held_by[1] != "connectors":
+                    continue
+                item = items.get(held_by[0])
+                if item is None:
+                    continue
+            if isinstance(item, Block_Item):
+                blocks[item] = None
+            elif {"source", "sink"} & names:
+                return False
+        self._hold_avoid_updates = True
+        try:
+            for b in blocks:
+                if not b.update_from_model(changes):
+                    return False
+        finally:
+            self._hold_avoid_updates = False
+        if self._avoid_updates_held:
+            self._avoid_updates_held = False
+            self.process_avoid_updates()
+        return True
+
+    def _matches_model(self):
+        # Whether there is one item for each symbol and connection
+        symbols = self.entity.symbols
+        connections = self.entity.connections
+        items = self._items
+        return (len(self._block_items) == len(symbols) and
+                len(self._connection_items) == len(connections) and
+                all(s in items for s in symbols) and
+                all(c in items for c in connections))
 
     def _hide_duplicate_connections(self):
         processed_connections = []
@@ -1237,9 +1360,7 @@ class Diagram_Item(QGraphicsItem):
 class Diagram_Editor(scene.Item_Viewer):
     def __init__(self, entity, env):
         d = Diagram_Item(entity)
-        d.modified_callback = self.set_modified
         super().__init__(d)
-        self.modified_callback = env.set_modified
         self.entity = entity
 
         show_ports_action = QAction("Connection Ports", self)
@@ -1260,7 +1381,5 @@ class Diagram_Editor(scene.Item_Viewer):
 class Block_Editor(scene.Item_Viewer):
     def __init__(self, entity, env):
         b = Block_Item(entity)
-        b.modified_callback = self.set_modified
         super().__init__(b)
-        self.modified_callback = env.set_modified
         self.entity = entity
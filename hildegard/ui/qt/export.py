@@ -0,0 +1,110 @@
+# Copyright (c) 2020 Jeffrey A. Webb
+
+# Exports every diagram of a project without showing the GUI.  Qt runs
+# on the offscreen platform, and the diagrams are spread across worker
+# processes, which build, route and export the diagrams given to them.
+# Workers load the diagrams from a binary file, lazily, so each one
+# decodes only its own.  Other projects are written to a temporary
+# binary file first.
+
+from . import scene
+from .diagram import Diagram_Item
+from ...common import Environment
+from ...diagram import Diagram
+import wumps
+
+from qtpy.QtWidgets import QApplication, QGraphicsScene
+
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+import re
+import tempfile
+
+def _export_png(diagram_scene, file_name):
+    # Unlike export_as_png(), leaves the clipboard alone
+    print(f"exporting PNG to file: {file_name}")
+    scene.render_image(diagram_scene).save(file_name)
+
+_exporters = {
+    "svg": scene.export_as_svg,
+    "png": _export_png,
+    "pdf": scene.export_as_pdf,
+}
+
+def _is_diagram(entity):
+    if isinstance(entity, wumps.Lazy_Entity):
+        return issubclass(entity.entity_type, Diagram)
+    return isinstance(entity, Diagram)
+
+def _file_names(names):
+    # A distinct file name, without extension, for each diagram name
+    used = set()
+    result = []
+    for name in names:
+        base = re.sub(r"[^\w.-]+", "_", name or "").strip("._") or "diagram"
+        file_name = base
+        n = 2
+        while file_name in used:
+            file_name = f"{base}_{n}"
+            n += 1
+        used.add(file_name)
+        result.append(file_name)
+    return result
+
+# State of a worker process
+_app = None
+_diagrams = None
+
+def _start(file_name):
+    global _app, _diagrams
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    if _app is None:
+        _app = QApplication.instance() or QApplication([])
+    # Binary files are loaded lazily, so only the diagrams exported
+    # here are decoded
+    env = Environment(file_name)
+    _diagrams = [e for e in env.entities() if _is_diagram(e)]
+
+def _export(index, file_names):
+    item = Diagram_Item(wumps.resolve(_diagrams[index]))
+    diagram_scene = QGraphicsScene()
+    diagram_scene.addItem(item)
+    diagram_scene.setSceneRect(diagram_scene.itemsBoundingRect())
+    for file_name in file_names:
+        extension = os.path.splitext(file_name)[1][1:]
+        _exporters[extension](diagram_scene, file_name)
+    diagram_scene.removeItem(item)
+    _diagrams[index] = None # Done with it
+    return file_names
+
+def export_project(file_name, directory=".", formats=("svg",), jobs=None):
+    # Exports the diagrams of the project file_name to directory, in
+    # jobs worker processes (default: one per CPU).  Returns the
+    # names of the files written.
+    _start(file_name)
+    names = _file_names([d.name for d in _diagrams])
+    os.makedirs(directory, exist_ok=True)
+    tasks = [(i, [os.path.join(directory, f"{name}.{format}")
+                  for format in formats])
+             for i, name in enumerate(names)]
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    jobs = min(jobs, len(tasks))
+    written = []
+    if jobs <= 1:
+        for index, file_names in tasks:
+            written.extend(_export(index, file_names))
+        return written
+    with tempfile.TemporaryDirectory() as temp:
+        if wumps.file_format(file_name) != "binary":
+            file_name = os.path.join(temp, "diagrams.hpb")
+            wumps.save(_diagrams, file_name, format="binary")
+        # Qt does not survive fork(), so the workers are started afresh
+        with ProcessPoolExecutor(
+                max_workers=jobs,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_start, initargs=(file_name,)) as pool:
+            for file_names in pool.map(_export, *zip(*tasks)):
+                written.extend(file_names)
+    return written
@@ -1,5 +1,7 @@
 # Copyright (c) 2020 Jeffrey A. Webb
 
+from .scene import undo_stack
+
 from qtpy.QtCore import Qt
 from qtpy.QtGui import QBrush, QPen
 from qtpy.QtWidgets import QGraphicsRectItem
@@ -119,7 +121,17 @@ class Handle(QGraphicsRectItem):
             self._last_mouse_scene_pos = event.scenePos()
             self._last_parent_rect = self.parentItem().rect()
             self._last_parent_pos = self.parentItem().pos()
+            stack = undo_stack(self)
+            if stack is not None:
+                stack.begin_gesture("Resize")
         super().mousePressEvent(event)
+
+    def mouseReleaseEvent(self, event):
+        super().mouseReleaseEvent(event)
+        if (event.button() == Qt.LeftButton):
+            stack = undo_stack(self)
+            if stack is not None:
+                stack.end()
         
     def mouseMoveEvent(self, event):
         old_p = self.parentItem().mapFromScene(self._last_mouse_scene_pos)
@@ -1,5 +1,7 @@
 # Copyright (c) 2020 Jeffrey A. Webb
 
+from contextlib import contextmanager
+
 from qtpy.QtCore import QBuffer, QMimeData, QPoint, QRect, QRectF, QSize, Qt
 from qtpy.QtGui import QClipboard, QIcon, QImage, QPainter
 from qtpy.QtSvg import QSvgGenerator
@@ -8,12 +10,32 @@ from qtpy.QtWidgets import (
     QWidget, qApp)
 from qtpy.QtPrintSupport import QPrinter
 
+def undo_stack(item):
+    # The Undo_Stack of the editor showing item, if any
+    while item is not None:
+        stack = getattr(item, "undo_stack", None)
+        if stack is not None:
+            return stack
+        item = item.parentItem()
+    return None
+
+@contextmanager
+def command(item, label):
+    # Makes the changes made inside one command of the Undo_Stack of
+    # the editor showing item, if any
+    stack = undo_stack(item)
+    if stack is None:
+        yield
+    else:
+        with stack.command(label):
+            yield
+
 class Item_Viewer(QWidget):
     def __init__(self, item):
         super().__init__()
         
         self._shown = False
-        self.modified_callback = None
+        self.subscription = None # Model changes, see GUI_Environment
         
         scene = QGraphicsScene()
         self.scene = scene
@@ -138,10 +160,6 @@ class Item_Viewer(QWidget):
                     return
         super().mouseDoubleClickEvent(event)
 
-    def set_modified(self, subitem=None):
-        if self.modified_callback:
-            self.modified_callback(self)
-        
 class View(QGraphicsView):
     def __init__(self, parent):
         super().__init__(parent)
@@ -17,11 +17,13 @@ class Interface(Entity):
     _attributes = (
         Attribute("ports", elements(Port, "port")),
     )
+    _shared = True
 
 class Implementation(Entity):
     _attributes = (
         Attribute("interface", Interface),
     )
+    _shared = True
 
 class Instance(Entity):
     _attributes = (
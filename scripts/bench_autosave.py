@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2020 Jeffrey A. Webb
+
+from pathlib import Path
+import sys
+
+# Add the project root directory to sys.path so that the local
+# modules are used.
+hildegard_root = str(Path(sys.path[0]) / Path(".."))
+sys.path.insert(1, hildegard_root)
+
+from bench_save import best_time
+from generate_project import make_project
+from hildegard.diagram import (
+    Block, Connector, Connection, Diagram, Endpoint)
+from pidgen import component
+import wumps
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+def create_parser():
+    parser = argparse.ArgumentParser(
+        description="Measure the per-edit cost of change tracking and the "
+        "cost of recording edits in the recovery file.")
+    parser.add_argument("--diagrams", type=int, default=4)
+    parser.add_argument("--blocks", type=int, default=2000,
+                        help="blocks per diagram")
+    parser.add_argument("--connectors", type=int, default=3,
+                        help="connectors per block")
+    parser.add_argument("--edits", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    return parser
+
+def edit_blocks(blocks, n):
+    for i in range(n):
+        blocks[i % len(blocks)].x = float(i)
+
+def edit_connectors(blocks, n):
+    for i in range(n):
+        connectors = blocks[i % len(blocks)].connectors
+        connectors.append(connectors.pop())
+
+def main(argv=None):
+    args = create_parser().parse_args(argv)
+    project = make_project(args.diagrams, args.blocks, args.connectors)
+    blocks = [s for d in project if isinstance(d, Diagram)
+              for s in d.symbols]
+    map = {
+        "Diagram": Diagram,
+        "Block": Block,
+        "Connector": Connector,
+        "Connection": Connection,
+        "Endpoint": Endpoint,
+        "Port": component.Port,
+        "Interface": component.Interface,
+        "Implementation": component.Implementation,
+        "Instance": component.Instance,
+        "Channel": component.Channel,
+        "Hierarchy": component.Hierarchy,
+    }
+    directory = tempfile.mkdtemp()
+    try:
+        file_name = os.path.join(directory, "project.hp")
+        journal = wumps.Journal(file_name, map)
+        t_full = best_time(lambda: journal.compact(project), 1)
+        journal.close()
+
+        results = []
+        for label, edit in (("attribute", edit_blocks),
+                            ("container", edit_connectors)):
+            t_plain = best_time(lambda: edit(blocks, args.edits),
+                                args.repeat)
+            journal.attach(project)
+            t_tracked = best_time(lambda: edit(blocks, args.edits),
+                                  args.repeat)
+            start = time.perf_counter()
+            journal.autosave(project)
+            t_autosave = time.perf_counter() - start
+            journal.save(project)
+            journal.close()
+            results.append((label, t_plain, t_tracked, t_autosave))
+    finally:
+        shutil.rmtree(directory)
+
+    print(f"{args.diagrams} diagrams, {args.blocks} blocks each, "
+          f"{len(blocks)} blocks edited {args.edits} times")
+    print(f"full save: {t_full:.3f} s")
+    for label, t_plain, t_tracked, t_autosave in results:
+        per_edit = 1e6*(t_tracked - t_plain)/args.edits
+        print(f"{label} edits: {1e6*t_plain/args.edits:.3f} us untracked, "
+              f"{1e6*t_tracked/args.edits:.3f} us tracked "
+              f"(+{per_edit:.3f} us), autosave {1e3*t_autosave:.1f} ms")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2020 Jeffrey A. Webb
+
+from pathlib import Path
+import sys
+
+# Add the project root directory to sys.path so that the local
+# modules are used.
+hildegard_root = str(Path(sys.path[0]) / Path(".."))
+sys.path.insert(1, hildegard_root)
+
+from hildegard.diagram import Block, Connector, Endpoint
+from pidgen import component
+from wumps import Entity
+
+from collections import OrderedDict
+import argparse
+import time
+
+def create_parser():
+    parser = argparse.ArgumentParser(
+        description="Compare entity construction with the generic and "
+        "the generated constructors.")
+    parser.add_argument("--count", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    return parser
+
+def _generic_init(self, *args, **kw):
+    # The constructor that was used before they were generated
+    setters = self._init_setters
+    for a in self._attr_info_list:
+        if a.fixed_value:
+            continue
+        setters[a.name](self, (
+            a.default if a.use_default else a.type() if
+            a.type is not None else None))
+    for key, value in kw.items():
+        a = self._attr_info[key]
+        if a.fixed_value:
+            continue
+        is_entity = False
+        if isinstance(value, Entity):
+            is_entity = True
+        elif isinstance(value, list) and value:
+            if isinstance(value[0], Entity):
+                if not issubclass(a.type, list):
+                    if not issubclass(a.type, OrderedDict):
+                        is_entity = True
+        if (a.type is not None and
+            not is_entity): # Entities are copied with clone()
+            value = a.type(value)
+        elif (not issubclass(a.type, list) and
+              not issubclass(a.type, OrderedDict) and
+              isinstance(value, list) and value):
+            value = value[0]
+        self._setters[a.name](self, value)
+
+def throughput(func, count, repeat):
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        for j in range(count):
+            func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return count / best
+
+def main(argv=None):
+    args = create_parser().parse_args(argv)
+    port = component.Port(name="Port 1")
+    connector = Connector(name="Connector 1", port=port, row=0)
+    cases = (
+        ("Port()", component.Port, {}),
+        ("Connector(...)", Connector,
+         dict(name="Connector 1", port=port, row=0, col=2)),
+        ("Block(...)", Block,
+         dict(name="Block 1", x=10.0, y=20.0, width=100.0, height=80.0)),
+        ("Endpoint(...)", Endpoint, dict(connector=connector)),
+    )
+    print(f"{'':16} {'generic':>12} {'generated':>12}")
+    for label, entity_type, kw in cases:
+        def generic():
+            _generic_init(entity_type.__new__(entity_type), **kw)
+        def generated():
+            entity_type._init(entity_type.__new__(entity_type), **kw)
+        before = throughput(generic, args.count, args.repeat)
+        after = throughput(generated, args.count, args.repeat)
+        print(f"{label:16} {before:10.0f}/s {after:10.0f}/s "
+              f"({after/before:.2f}x)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2020 Jeffrey A. Webb
+
+from pathlib import Path
+import sys
+
+# Add the project root directory to sys.path so that the local
+# modules are used.
+hildegard_root = str(Path(sys.path[0]) / Path(".."))
+sys.path.insert(1, hildegard_root)
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+
+# Imported only by the GUI
+_gui_modules = ("qtpy", "PySide2", "adaptagrams")
+
+def create_parser():
+    parser = argparse.ArgumentParser(
+        description="Time the import of hildegard modules in fresh "
+        "interpreters with -X importtime and record the results as JSON.")
+    parser.add_argument(
+        "--modules", default="wumps,hildegard.diagram,hildegard.__main__",
+        help="comma separated modules to import")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=5,
+                        help="slowest imports to list for each module")
+    parser.add_argument("--output", help="write the results to this file")
+    parser.add_argument("--compare",
+                        help="results of an earlier run to compare with")
+    return parser
+
+def revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=hildegard_root,
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def import_times(statement):
+    # {module: (self us, cumulative us, nesting level)} for the modules
+    # imported by statement in a fresh interpreter, and its wall time
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [hildegard_root] + env.get("PYTHONPATH", "").split(os.pathsep))
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        env=env, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"{statement!r} failed:\n{result.stderr}")
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if not fields[0].strip().isdigit():
+            continue # Column titles
+        name = fields[2].rstrip()
+        level = (len(name) - len(name.lstrip()))//2
+        times[name.strip()] = (int(fields[0]), int(fields[1]), level)
+    return times, elapsed
+
+def measure(module, baseline, repeat):
+    # Best times over repeat runs, leaving out what the interpreter
+    # imports on its own
+    best = None
+    for i in range(repeat):
+        times, elapsed = import_times(f"import {module}")
+        total = sum(cumulative for name, (own, cumulative, level)
+                    in times.items() if level == 0 and name not in baseline)
+        if best is None or total < best[0]:
+            best = (total, elapsed, times)
+    total, elapsed, times = best
+    return {
+        "module": module,
+        "import_time": total/1e6,
+        "wall_time": elapsed,
+        "modules": sum(1 for name in times if name not in baseline),
+        "gui_loaded": any(name.split(".")[0] in _gui_modules
+                          for name in times),
+        "slowest": sorted(
+            ((name, own/1e6) for name, (own, cumulative, level)
+             in times.items() if name not in baseline),
+            key=lambda item: -item[1]),
+    }
+
+def run(args):
+    baseline = set(import_times("pass")[0])
+    results = []
+    for module in args.modules.split(","):
+        result = measure(module, baseline, args.repeat)
+        result["slowest"] = result["slowest"][:args.top]
+        results.append(result)
+        print(f"{module:24} {result['import_time']*1e3:8.1f} ms "
+              f"{result['wall_time']*1e3:8.1f} ms {result['modules']:8} "
+              f"{'yes' if result['gui_loaded'] else 'no':>4}", flush=True)
+        for name, own in result["slowest"]:
+            print(f"    {name:32} {own*1e3:8.1f} ms")
+    return results
+
+def compare(results, old_results):
+    old = {r["module"]: r for r in old_results}
+    print(f"\n{'change':24} {'import':>8} {'wall':>8}")
+    for r in results:
+        o = old.get(r["module"])
+        if o is None:
+            continue
+        ratios = [r[key]/o[key] if o[key] else float("nan")
+                  for key in ("import_time", "wall_time")]
+        print(f"{r['module']:24} " + " ".join(f"{x:7.2f}x" for x in ratios))
+
+def main(argv=None):
+    args = create_parser().parse_args(argv)
+    print(f"{'module':24} {'import':>11} {'wall':>11} {'modules':>8} "
+          f"{'gui':>4}")
+    results = run(args)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f)["results"])
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "revision": revision(),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "cpus": os.cpu_count(),
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "results": results,
+            }, f, indent=2)
+            f.write("\n")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
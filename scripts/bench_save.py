@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2020 Jeffrey A. Webb
+
+from pathlib import Path
+import sys
+
+# Add the project root directory to sys.path so that the local
+# modules are used.
+hildegard_root = str(Path(sys.path[0]) / Path(".."))
+sys.path.insert(1, hildegard_root)
+
+from generate_project import add_size_arguments, make_project
+import wumps
+from wumps.base import save_to
+
+import argparse
+import io
+import os
+import re
+import tempfile
+import time
+
+def create_parser():
+    parser = argparse.ArgumentParser(
+        description="Compare wumps.dump() with the recursive save_to().")
+    add_size_arguments(parser)
+    parser.add_argument("--repeat", type=int, default=3)
+    return parser
+
+def normalize_ids(text):
+    # save_to() writes memory addresses as ids, so number them in
+    # order of appearance before comparing outputs.
+    ids = {}
+    def replace(match):
+        key, value = match.groups()
+        return f"{key}: {ids.setdefault(value, len(ids) + 1)}"
+    return re.sub(r"(_id|connector): (\d+)", replace, text)
+
+def best_time(func, repeat):
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main(argv=None):
+    args = create_parser().parse_args(argv)
+    project = make_project(args.diagrams, args.blocks, args.connectors,
+                           args.connections, args.seed)
+
+    old = io.StringIO()
+    save_to(project, file=old)
+    new = io.StringIO()
+    wumps.dump(project, file=new)
+    if (normalize_ids(old.getvalue()) !=
+        normalize_ids(new.getvalue())):
+        print("error: dump() output differs from save_to()")
+        return 1
+    print(f"{args.diagrams} diagrams, {args.blocks} blocks each, "
+          f"{len(new.getvalue())} bytes")
+
+    fd, file_name = tempfile.mkstemp(suffix=".hp")
+    os.close(fd)
+    try:
+        def run_save_to():
+            with open(file_name, "w") as f:
+                save_to(project, file=f)
+        def run_dump():
+            with open(file_name, "w") as f:
+                wumps.dump(project, file=f)
+        t_old = best_time(run_save_to, args.repeat)
+        t_new = best_time(run_dump, args.repeat)
+    finally:
+        os.remove(file_name)
+    print(f"save_to: {t_old:.3f} s")
+    print(f"dump:    {t_new:.3f} s ({t_old/t_new:.2f}x)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
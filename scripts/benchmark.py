@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2020 Jeffrey A. Webb
+
+from pathlib import Path
+import sys
+
+# Add the project root directory to sys.path so that the local
+# modules are used.
+hildegard_root = str(Path(sys.path[0]) / Path(".."))
+sys.path.insert(1, hildegard_root)
+
+from generate_project import add_size_arguments, make_project
+import generate_project
+from hildegard.common import Environment
+import wumps
+from wumps.base import Reference_Index
+
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+_extensions = {"yaml": ".hp", "binary": ".hpb", "directory": ".hpd"}
+
+def create_parser():
+    parser = argparse.ArgumentParser(
+        description="Time wumps.save() and wumps.load() on synthetic "
+        "projects and record the results as JSON.")
+    parser.add_argument("--sizes", default="1x100,4x500,4x2000",
+                        help="comma separated DIAGRAMSxBLOCKS, used unless "
+                        "--diagrams or --blocks is given")
+    add_size_arguments(parser)
+    parser.set_defaults(diagrams=None, blocks=None)
+    parser.add_argument("--formats", default="yaml,binary,directory")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="write the results to this file")
+    parser.add_argument("--compare",
+                        help="results of an earlier run to compare with")
+    return parser
+
+def revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=hildegard_root,
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def quietly(func):
+    # wumps.save() prints the name of the file or directory
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func()
+
+def best_time(func, repeat):
+    best = None
+    for i in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        quietly(func)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def peak_memory(func):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        quietly(func)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def file_size(file_name):
+    if os.path.isdir(file_name):
+        return sum(os.path.getsize(os.path.join(file_name, name))
+                   for name in os.listdir(file_name))
+    return os.path.getsize(file_name)
+
+def remove(file_name):
+    if os.path.isdir(file_name):
+        shutil.rmtree(file_name)
+    elif os.path.exists(file_name):
+        os.remove(file_name)
+
+def sizes(args):
+    if args.diagrams is None and args.blocks is None:
+        return [tuple(int(n) for n in size.split("x"))
+                for size in args.sizes.split(",")]
+    # A single size, with the defaults of generate_project
+    defaults = generate_project.create_parser()
+    return [(defaults.get_default("diagrams") if args.diagrams is None
+             else args.diagrams,
+             defaults.get_default("blocks") if args.blocks is None
+             else args.blocks)]
+
+def _key(result):
+    # Earlier results have one connection per block
+    return (result["format"], result["diagrams"], result["blocks"],
+            result["connectors"],
+            result.get("connections", result["blocks"]))
+
+def run(args, directory):
+    map = Environment([])._entity_map()
+    results = []
+    for n_diagrams, n_blocks in sizes(args):
+        size = f"{n_diagrams}x{n_blocks}"
+        n_connections = (n_blocks if args.connections is None
+                         else args.connections)
+        project = make_project(n_diagrams, n_blocks, args.connectors,
+                               n_connections, args.seed)
+        entities = Reference_Index(project).entity_count
+        for format in args.formats.split(","):
+            file_name = os.path.join(
+                directory, "project" + _extensions[format])
+            def save():
+                remove(file_name)
+                wumps.save(project, file_name=file_name, format=format)
+            def load():
+                wumps.load(file_name, map)
+            result = {
+                "format": format,
+                "diagrams": n_diagrams,
+                "blocks": n_blocks,
+                "connectors": args.connectors,
+                "connections": n_connections,
+                "entities": entities,
+                "save_time": best_time(save, args.repeat),
+                "save_peak_memory": peak_memory(save),
+                "file_size": file_size(file_name),
+                "load_time": best_time(load, args.repeat),
+                "load_peak_memory": peak_memory(load),
+            }
+            remove(file_name)
+            results.append(result)
+            print(f"{format:9} {size:>9} {result['save_time']:8.3f} s "
+                  f"{result['load_time']:8.3f} s "
+                  f"{result['load_peak_memory']/2**20:8.1f} MB "
+                  f"{result['file_size']/2**20:8.1f} MB", flush=True)
+    return results
+
+def compare(results, old_results):
+    old = {_key(r): r for r in old_results}
+    print(f"\n{'change':20} {'save':>8} {'load':>8} {'memory':>8} "
+          f"{'size':>8}")
+    for r in results:
+        o = old.get(_key(r))
+        if o is None:
+            continue
+        ratios = [r[key]/o[key] if o[key] else float("nan") for key in
+                  ("save_time", "load_time", "load_peak_memory", "file_size")]
+        label = f"{r['format']} {r['diagrams']}x{r['blocks']}"
+        print(f"{label:20} " + " ".join(f"{x:7.2f}x" for x in ratios))
+
+def main(argv=None):
+    args = create_parser().parse_args(argv)
+    print(f"{'format':9} {'size':>9} {'save':>10} {'load':>10} "
+          f"{'memory':>11} {'file':>11}")
+    directory = tempfile.mkdtemp()
+    try:
+        results = run(args, directory)
+    finally:
+        shutil.rmtree(directory)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f)["results"])
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "revision": revision(),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "cpus": os.cpu_count(),
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "results": results,
+            }, f, indent=2)
+            f.write("\n")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
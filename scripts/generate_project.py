@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2020 Jeffrey A. Webb
+
+from pathlib import Path
+import sys
+
+# Add the project root directory to sys.path so that the local
+# modules are used.
+hildegard_root = str(Path(sys.path[0]) / Path(".."))
+sys.path.insert(1, hildegard_root)
+
+from hildegard.diagram import Block, Connector, Connection, Diagram, Endpoint
+from pidgen import component
+import wumps
+
+import argparse
+import random
+
+def create_parser():
+    parser = argparse.ArgumentParser(
+        description="Write a synthetic project of the given size.")
+    parser.add_argument("file_name",
+                        help="project file (.hp, .hpb or .hpd)")
+    add_size_arguments(parser)
+    return parser
+
+def add_size_arguments(parser):
+    parser.add_argument("--diagrams", type=int, default=4)
+    parser.add_argument("--blocks", type=int, default=500,
+                        help="blocks per diagram")
+    parser.add_argument("--connectors", type=int, default=4,
+                        help="connectors per block")
+    parser.add_argument("--connections", type=int, default=None,
+                        help="connections per diagram (default: blocks)")
+    parser.add_argument("--seed", type=int, default=0)
+
+def make_project(n_diagrams, n_blocks, n_connectors, n_connections=None,
+                 seed=0):
+    # Returns the top-level entities: one interface and implementation
+    # shared by all blocks, then the diagrams.  Each diagram has a
+    # hierarchy with one instance per block, and connections between
+    # connectors of randomly chosen blocks.
+    if n_connections is None:
+        n_connections = n_blocks
+    rng = random.Random(seed)
+    interface = component.Interface(
+        name="Interface",
+        ports=[(f"Port {i}", component.Port(name=f"Port {i}"))
+               for i in range(n_connectors)])
+    implementation = component.Implementation(
+        name="Implementation", interface=interface)
+    ports = list(interface.ports.values())
+    project = [interface, implementation]
+    for di in range(n_diagrams):
+        hierarchy = component.Hierarchy(
+            name=f"Hierarchy {di}", interface=interface)
+        d = Diagram(name=f"Diagram {di}", hierarchy=hierarchy)
+        for bi in range(n_blocks):
+            instance = component.Instance(
+                interface=interface, implementation=implementation)
+            hierarchy.subcomponents[f"Instance {bi}"] = instance
+            b = Block(instance=instance, x=20.0*(bi % 50),
+                      y=120.0*(bi // 50), width=100.0,
+                      height=20.0*(n_connectors + 1))
+            for ci in range(n_connectors):
+                b.connectors.append(Connector(
+                    name=f"Connector {ci}", port=ports[ci], row=ci,
+                    col=2 if ci % 2 else 0))
+            d.symbols.append(b)
+        if n_blocks > 1 and n_connectors:
+            for i in range(n_connections):
+                source, sink = rng.sample(range(n_blocks), 2)
+                d.connections.append(Connection(
+                    channel=component.Channel(),
+                    source=Endpoint(connector=rng.choice(
+                        d.symbols[source].connectors)),
+                    sink=Endpoint(connector=rng.choice(
+                        d.symbols[sink].connectors))))
+        project.append(d)
+    return project
+
+def format_of(file_name):
+    for extension, format in ((".hpb", "binary"), (".hpd", "directory")):
+        if file_name.endswith(extension):
+            return format
+    return "yaml"
+
+def main(argv=None):
+    args = create_parser().parse_args(argv)
+    project = make_project(args.diagrams, args.blocks, args.connectors,
+                           args.connections, args.seed)
+    wumps.save(project, file_name=args.file_name,
+               format=format_of(args.file_name))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
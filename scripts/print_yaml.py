@@ -7,8 +7,8 @@ import sys
 import pprint
 
 def main(args):
-    content = open(args[1]).read()
-    y = yaml.load(content)
+    with open(args[1]) as f:
+        y = yaml.load(f, Loader=yaml.SafeLoader)
     pprint.pprint(y)
     
 if __name__ == "__main__":
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2020 Jeffrey A. Webb
+
+from pathlib import Path
+import sys
+
+# Add the project root directory to sys.path so that the local
+# modules are used.
+hildegard_root = str(Path(sys.path[0]) / Path(".."))
+sys.path.insert(1, hildegard_root)
+
+import hildegard.diagram # Registers the migrations of diagram files
+import wumps
+
+import argparse
+
+def create_parser():
+    parser = argparse.ArgumentParser(
+        description="Upgrade a YAML project file saved by an earlier version.")
+    parser.add_argument("file_name", help="project file (.hp)")
+    parser.add_argument("-o", "--output",
+                        help="file to write (default: upgrade in place)")
+    return parser
+
+def main(argv=None):
+    args = create_parser().parse_args(argv)
+    version = wumps.upgrade(args.file_name, args.output)
+    print(f"upgraded from version {version[0]}.{version[1]}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,6 +9,9 @@ setup(
     version="0.1",
     packages=find_packages(),
     install_requires=["qtpy", "pyside2"],
+    extras_require={
+        "geometry": ["numpy"], # Diagram.geometry()
+    },
     entry_points={
         # "console_scripts": [
         "gui_scripts": [
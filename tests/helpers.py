@@ -0,0 +1,24 @@
+# Copyright (c) 2020 Jeffrey A. Webb
+
+# Small projects shared by the tests
+
+from hildegard.diagram import (
+    Block, Connection, Connector, Diagram, Endpoint)
+
+MAP = {"Diagram": Diagram, "Block": Block, "Connector": Connector,
+       "Connection": Connection, "Endpoint": Endpoint}
+
+def diagram(name, blocks=("Block",)):
+    # A diagram of blocks with the given names, each with one connector
+    d = Diagram(name=name)
+    for block_name in blocks:
+        block = Block(name=block_name)
+        block.connectors.append(Connector(name="Connector"))
+        d.symbols.append(block)
+    return d
+
+def connect(d, source, sink):
+    # Connects the first blocks of the diagrams source and sink in d
+    d.connections.append(Connection(
+        source=Endpoint(connector=source.symbols[0].connectors[0]),
+        sink=Endpoint(connector=sink.symbols[0].connectors[0])))
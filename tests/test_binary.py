@@ -0,0 +1,56 @@
+# Copyright (c) 2020 Jeffrey A. Webb
+
+import io
+
+from helpers import MAP, connect, diagram
+import wumps
+from wumps import base
+
+class _Counter:
+    def __init__(self):
+        self.changes = 0
+
+    def _changing(self, entity, key):
+        self.changes += 1
+
+    def _changed(self, entity, key):
+        self.changes += 1
+
+def test_lazy_decoding_is_not_a_change(tmp_path):
+    # Each diagram refers to a connector of the other, so references
+    # are left to be resolved once both are decoded
+    first = diagram("First")
+    second = diagram("Second")
+    connect(first, first, second)
+    connect(second, second, first)
+    file_name = str(tmp_path / "project.hpb")
+    wumps.save([first, second], file_name, format="binary")
+    counter = _Counter()
+    base._trackers.append(counter)
+    base._recorders.append(counter)
+    try:
+        loaded = wumps.load(file_name, MAP, lazy=True)
+        first, second = [wumps.resolve(e) for e in loaded]
+    finally:
+        base._trackers.remove(counter)
+        base._recorders.remove(counter)
+    assert counter.changes == 0
+    assert (first.connections[0].sink.connector is
+            second.symbols[0].connectors[0])
+    assert (second.connections[0].sink.connector is
+            first.symbols[0].connectors[0])
+
+def test_load_from_streams(tmp_path):
+    d = diagram("Diagram", ["First", "Second"])
+    for format in ("binary", "yaml"):
+        file_name = str(tmp_path / f"project.{format}")
+        wumps.save([d], file_name, format=format)
+        with open(file_name, "rb") as f:
+            data = f.read()
+        for stream in (open(file_name, "rb"), io.BytesIO(data)):
+            with stream:
+                loaded, = wumps.load(stream, MAP)
+            assert [b.name for b in loaded.symbols] == ["First", "Second"]
+    with open(file_name) as f:
+        loaded, = wumps.load(f, MAP)
+    assert loaded.name == "Diagram"
@@ -0,0 +1,36 @@
+# Copyright (c) 2020 Jeffrey A. Webb
+
+import copy
+
+from hildegard.diagram import Block, Connection, Connector, Diagram, Endpoint
+from pidgen import component
+import wumps
+
+def test_clone_shares_subject():
+    port = component.Port(name="Port")
+    connector = Connector(port=port)
+    assert wumps.clone(connector).subject is connector.subject
+    assert copy.deepcopy(connector).subject is port
+
+def test_clone_block_keeps_instance():
+    block = Block(name="Block", x=1.0, y=2.0)
+    block.connectors.append(Connector(name="Connector"))
+    block.widget = object()
+    block_copy = wumps.clone(block)
+    assert block_copy.subject is block.subject
+    assert block_copy.widget is None
+    assert block_copy.connectors[0] is not block.connectors[0]
+    assert block_copy.connectors[0].name == "Connector"
+
+def test_clone_remaps_internal_references():
+    d = Diagram(name="Diagram")
+    for i in range(2):
+        b = Block(name=f"Block {i}")
+        b.connectors.append(Connector(name="Connector"))
+        d.symbols.append(b)
+    d.connections.append(Connection(
+        source=Endpoint(connector=d.symbols[0].connectors[0]),
+        sink=Endpoint(connector=d.symbols[1].connectors[0])))
+    d_copy = wumps.clone(d)
+    assert (d_copy.connections[0].source.connector is
+            d_copy.symbols[0].connectors[0])
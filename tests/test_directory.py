@@ -0,0 +1,85 @@
+# Copyright (c) 2020 Jeffrey A. Webb
+
+import gc
+import os
+import weakref
+
+from helpers import MAP, connect, diagram
+from hildegard.diagram import Block
+import wumps
+from wumps import directory
+
+def test_prepared_save_writes_snapshot(tmp_path, monkeypatch):
+    # Written from threads, as in the GUI, after the entities changed
+    monkeypatch.setattr(directory, "_parallel_save_count", 0)
+    first = diagram("First")
+    second = diagram("Second")
+    connect(first, first, second)
+    connect(second, second, first)
+    name = str(tmp_path / "project.hpd")
+    project = wumps.Project_Directory(name, MAP, fork=False)
+    write = project.prepare_save([first, second])
+    first.name = "Changed"
+    first.symbols.append(Block(name="Added"))
+    progress = []
+    written = write(progress=lambda done, total: progress.append(done))
+    project.close()
+    assert written == ["0001.hp", "0002.hp"]
+    assert progress[-1] == 2
+    first, second = directory.load(name, MAP)
+    assert first.name == "First"
+    assert len(first.symbols) == 1
+    assert (first.connections[0].sink.connector is
+            second.symbols[0].connectors[0])
+    assert (second.connections[0].sink.connector is
+            first.symbols[0].connectors[0])
+
+def test_prepared_save_keeps_ids(tmp_path):
+    first = diagram("First")
+    second = diagram("Second")
+    connect(first, first, second)
+    name = str(tmp_path / "project.hpd")
+    project = wumps.Project_Directory(name, MAP, fork=False)
+    project.prepare_save([first, second])()
+    second.name = "Changed"
+    assert project.prepare_save([first, second])() == ["0002.hp"]
+    project.close()
+    assert sorted(os.listdir(name)) == ["0001.hp", "0002.hp", "index.yaml"]
+    first, second = directory.load(name, MAP)
+    assert second.name == "Changed"
+    assert (first.connections[0].sink.connector is
+            second.symbols[0].connectors[0])
+
+def test_round_trip_with_shared_file(tmp_path):
+    # Interfaces and implementations are kept in shared.hp by default
+    from pidgen.component import Implementation, Interface, Port
+    interface = Interface(name="Interface")
+    interface.ports["in"] = Port()
+    implementation = Implementation(name="Implementation",
+                                    interface=interface)
+    d = diagram("Diagram")
+    map = dict(MAP, Interface=Interface, Implementation=Implementation,
+               Port=Port)
+    name = str(tmp_path / "project.hpd")
+    wumps.save([interface, d, implementation], name, format="directory")
+    assert sorted(os.listdir(name)) == ["0001.hp", "index.yaml", "shared.hp"]
+    loaded = wumps.load(name, map)
+    assert [e.name for e in loaded] == [
+        "Interface", "Diagram", "Implementation"]
+    assert loaded[2].interface.name == "Interface"
+    assert list(loaded[0].ports) == ["in"]
+
+def test_deleted_entities_are_released(tmp_path):
+    first = diagram("First")
+    second = diagram("Second")
+    connect(first, first, second)
+    name = str(tmp_path / "project.hpd")
+    project = wumps.Project_Directory(name, MAP, fork=False)
+    project.save([first, second])
+    connector = weakref.ref(second.symbols[0].connectors[0])
+    del first.connections[0]
+    del second.symbols[0]
+    project.save([first, second])
+    gc.collect()
+    assert connector() is None
+    project.close()
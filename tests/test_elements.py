@@ -0,0 +1,80 @@
+# Copyright (c) 2020 Jeffrey A. Webb
+
+from hildegard.diagram import (
+    Block, Connection, Connector, Diagram, Endpoint, connections_of)
+from wumps import owner
+
+def test_assigned_list_is_owned():
+    d = Diagram(name="Diagram")
+    block = Block(name="Block")
+    connector = Connector(name="Connector")
+    block.connectors = [connector]
+    d.symbols = [block]
+    assert type(block.connectors) is Block._attr_info["connectors"].type
+    assert owner(connector) == (block, "connectors")
+    assert owner(block) == (d, "symbols")
+    d.connections = [Connection(source=Endpoint(connector=connector),
+                                sink=Endpoint(connector=connector))]
+    assert connections_of(connector) == [d.connections[0]]
+    d.remove_symbol(block)
+    assert not d.symbols and not d.connections
+
+def _connectors(n):
+    block = Block(name="Block")
+    for i in range(n):
+        block.connectors.append(Connector(name=f"Connector {i}"))
+    return block, block.connectors
+
+def _check_index(container):
+    # The identity index, once built, counts every element
+    assert all(c in container for c in container)
+    counts = {}
+    for c in container:
+        counts[id(c)] = counts.get(id(c), 0) + 1
+    assert container._counts == counts
+
+def test_index_follows_changes():
+    block, connectors = _connectors(4)
+    extra = Connector(name="Extra")
+    assert extra not in connectors
+    assert connectors._counts is not None
+    connectors.append(extra)
+    _check_index(connectors)
+    connectors.insert(0, Connector(name="First"))
+    _check_index(connectors)
+    removed = connectors.pop()
+    assert removed is extra and extra not in connectors
+    assert owner(extra) is None
+    _check_index(connectors)
+    first = connectors[0]
+    connectors.remove(first)
+    assert first not in connectors and owner(first) is None
+    _check_index(connectors)
+    replaced = connectors[1:3]
+    connectors[1:3] = [extra]
+    assert all(c not in connectors and owner(c) is None for c in replaced)
+    assert owner(extra) == (block, "connectors")
+    _check_index(connectors)
+    connectors *= 2
+    assert len(connectors) == 6
+    _check_index(connectors)
+    connectors.extend([Connector(name="Last")])
+    _check_index(connectors)
+    connectors.clear()
+    assert extra not in connectors and owner(extra) is None
+    _check_index(connectors)
+
+def test_duplicate_keeps_owner_until_last_removed():
+    block, connectors = _connectors(1)
+    connector = connectors[0]
+    connectors.append(connector)
+    connectors.remove(connector)
+    assert connector in connectors
+    assert owner(connector) == (block, "connectors")
+    connectors.append(connector)
+    connectors.pop()
+    assert owner(connector) == (block, "connectors")
+    connectors.pop()
+    assert connector not in connectors
+    assert owner(connector) is None
+    _check_index(connectors)
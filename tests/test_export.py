@@ -0,0 +1,35 @@
+# Copyright (c) 2020 Jeffrey A. Webb
+
+import os
+
+import pytest
+
+from hildegard.diagram import Block, Connector, Diagram
+import wumps
+
+def _project(file_name, names):
+    diagrams = []
+    for name in names:
+        d = Diagram(name=name)
+        block = Block(name="Block", x=10, y=10, width=100, height=100)
+        block.connectors.append(Connector(name="Connector"))
+        d.symbols.append(block)
+        diagrams.append(d)
+    wumps.save(diagrams, file_name)
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_export_offscreen(tmp_path, monkeypatch, jobs):
+    pytest.importorskip("qtpy")
+    monkeypatch.setenv("QT_QPA_PLATFORM", "offscreen")
+    from hildegard.ui.qt import export
+    file_name = str(tmp_path / "project.hp")
+    names = ["First", "Second"][:jobs]
+    _project(file_name, names)
+    directory = str(tmp_path / "out")
+    written = export.export_project(
+        file_name, directory, formats=("svg", "png"), jobs=jobs)
+    expected = [os.path.join(directory, f"{name}.{format}")
+                for name in names for format in ("svg", "png")]
+    assert sorted(written) == sorted(expected)
+    for path in expected:
+        assert os.path.getsize(path) > 0
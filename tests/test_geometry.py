@@ -0,0 +1,69 @@
+# Copyright (c) 2020 Jeffrey A. Webb
+
+import pytest
+
+from hildegard.diagram import Block, Diagram
+from wumps import base
+
+numpy = pytest.importorskip("numpy")
+
+def _diagram(n):
+    d = Diagram(name="Diagram")
+    for i in range(n):
+        d.symbols.append(Block(name=f"Block {i}", x=10.0*i, y=0.0,
+                               width=5.0, height=5.0))
+    return d
+
+def test_assignments_are_written_through():
+    d = _diagram(3)
+    table = d.geometry()
+    assert table.x.tolist() == [0.0, 10.0, 20.0]
+    d.symbols[1].x = 15.0
+    d.symbols[2]["width"] = 8.0
+    d.symbols[0].y = None
+    assert table.x.tolist() == [0.0, 15.0, 20.0]
+    assert table.width.tolist() == [5.0, 5.0, 8.0]
+    assert table.y.tolist() == [0.0, 0.0, 0.0]
+
+def test_translate_assigns_attributes():
+    d = _diagram(3)
+    table = d.geometry()
+    changes = []
+    class Tracker:
+        def _changed(self, entity, key):
+            changes.append((entity, key))
+    tracker = Tracker()
+    base._trackers.append(tracker)
+    try:
+        table.translate(d.symbols[1:], 1.0, 2.0)
+    finally:
+        base._trackers.remove(tracker)
+    assert [(s.x, s.y) for s in d.symbols] == [
+        (0.0, 0.0), (11.0, 2.0), (21.0, 2.0)]
+    assert table.x.tolist() == [0.0, 11.0, 21.0]
+    assert table.y.tolist() == [0.0, 2.0, 2.0]
+    assert changes == [(d.symbols[1], "x"), (d.symbols[1], "y"),
+                       (d.symbols[2], "x"), (d.symbols[2], "y")]
+
+def test_table_follows_symbols():
+    d = _diagram(3)
+    table = d.geometry()
+    assert table.extents() == (0.0, 0.0, 25.0, 5.0)
+    removed = d.symbols[2]
+    d.remove_symbol(removed)
+    added = Block(name="Added", x=-5.0, y=-5.0, width=1.0, height=1.0)
+    d.symbols.insert(0, added)
+    assert table.symbols() == list(d.symbols)
+    assert table.x.tolist() == [-5.0, 0.0, 10.0]
+    assert table.extents() == (-5.0, -5.0, 15.0, 5.0)
+    removed.x = 100.0 # No longer in the table
+    assert table.x.tolist() == [-5.0, 0.0, 10.0]
+    added.x = -6.0
+    assert table.x.tolist() == [-6.0, 0.0, 10.0]
+    assert table.hit(-7.0, -7.0, -4.0, -4.0) == [added]
+    assert table.overlapping(d.symbols[1]) == []
+
+def test_empty_diagram():
+    table = Diagram(name="Diagram").geometry()
+    assert table.extents() is None
+    assert table.symbols() == []
@@ -0,0 +1,26 @@
+# Copyright (c) 2020 Jeffrey A. Webb
+
+import gc
+
+from helpers import MAP, diagram
+from hildegard.diagram import Connection, Endpoint
+import wumps
+
+def test_deleted_entity_is_not_found(tmp_path):
+    d = diagram("Diagram", ["First", "Second"])
+    d.connections.append(Connection(
+        source=Endpoint(connector=d.symbols[0].connectors[0]),
+        sink=Endpoint(connector=d.symbols[1].connectors[0])))
+    file_name = str(tmp_path / "project.hp")
+    wumps.save([d], file_name)
+    ids = wumps.Id_Table()
+    d, = wumps.load(file_name, MAP, ids=ids)
+    connector = d.symbols[1].connectors[0]
+    number = next(n for n, e in ids.items() if e is connector)
+    assert ids.get(number) is connector
+    del d.connections[0]
+    del d.symbols[1]
+    del connector
+    gc.collect()
+    assert ids.get(number) is None
+    assert len(ids) == 1
@@ -0,0 +1,25 @@
+# Copyright (c) 2020 Jeffrey A. Webb
+
+import math
+
+from wumps.base import Intern_Table
+
+def test_equal_values_are_shared():
+    table = Intern_Table()
+    first = table("".join(["con", "nector"]))
+    assert table("".join(["conn", "ector"])) is first
+    assert table(float("1.5")) is table(float("1.5"))
+    assert table.hits == 2
+
+def test_nan_takes_no_slots():
+    table = Intern_Table(max_size=4)
+    for i in range(10):
+        assert math.isnan(table(float("nan")))
+    assert len(table._values) == 0
+    assert table(1.0) == 1.0
+    assert len(table._values) == 1
+
+def test_negative_zero_is_kept():
+    table = Intern_Table()
+    table(0.0)
+    assert math.copysign(1.0, table(-0.0)) < 0.0
@@ -0,0 +1,92 @@
+# Copyright (c) 2020 Jeffrey A. Webb
+
+import pytest
+
+from helpers import MAP, diagram
+from hildegard.diagram import (
+    Block, Connection, Connector, Endpoint)
+import wumps
+
+def _journal(file_name, format):
+    journal = wumps.Journal(file_name, MAP, format=format)
+    return journal, journal.load()
+
+@pytest.mark.parametrize("format, extension", [
+    ("yaml", ".hp"), ("binary", ".hpb")])
+def test_entity_reached_twice(tmp_path, format, extension):
+    # The shared block is written in both diagrams, so it is loaded as
+    # two entities, which must not change the keys of the others
+    first = diagram("First", ["A"])
+    second = diagram("Second", ["B", "C"])
+    second.symbols.insert(0, first.symbols[0])
+    file_name = str(tmp_path / ("project" + extension))
+    wumps.save([first, second], file_name, format=format)
+    journal, (first, second) = _journal(file_name, format)
+    assert journal.needs_compaction() # The file has no ids
+    journal.compact([first, second])
+    journal.close()
+
+    journal, (first, second) = _journal(file_name, format)
+    assert not journal.needs_compaction()
+    second.symbols[1].name = "Changed"
+    second.symbols[2].connectors[0].name = "Also changed"
+    assert not journal.save([first, second])
+    journal.close()
+
+    journal, (first, second) = _journal(file_name, format)
+    journal.close()
+    assert [b.name for b in first.symbols] == ["A"]
+    assert [b.name for b in second.symbols] == ["A", "Changed", "C"]
+    assert second.symbols[2].connectors[0].name == "Also changed"
+    assert first.symbols[0].connectors[0].name == "Connector"
+
+def test_new_entities_are_replayed(tmp_path):
+    d = diagram("Diagram", ["A"])
+    file_name = str(tmp_path / "project.hp")
+    journal = wumps.Journal(file_name, MAP)
+    journal.compact([d])
+    block = Block(name="B")
+    block.connectors.append(Connector(name="Connector"))
+    d.symbols.append(block)
+    d.connections.append(Connection(
+        source=Endpoint(connector=d.symbols[0].connectors[0]),
+        sink=Endpoint(connector=block.connectors[0])))
+    journal.save([d])
+    journal.close()
+    journal, (d,) = _journal(file_name, "yaml")
+    journal.close()
+    assert [b.name for b in d.symbols] == ["A", "B"]
+    assert (d.connections[0].sink.connector is
+            d.symbols[1].connectors[0])
+
+def test_untracked_changes_are_not_kept(tmp_path):
+    d = diagram("Diagram", ["A"])
+    file_name = str(tmp_path / "project.hp")
+    journal = wumps.Journal(file_name, MAP)
+    journal.compact([d])
+    block = Block(name="B")
+    block.name = "Renamed"
+    assert block not in journal._dirty
+    d.symbols[0].name = "Changed"
+    assert d.symbols[0] in journal._dirty
+    journal.close()
+
+def test_lazily_loaded_entities_are_tracked(tmp_path):
+    file_name = str(tmp_path / "project.hpb")
+    journal = wumps.Journal(file_name, MAP, format="binary")
+    journal.compact([diagram("First", ["A"]), diagram("Second", ["B"])])
+    journal.close()
+
+    journal = wumps.Journal(file_name, MAP, format="binary")
+    first, second = journal.load(lazy=True)
+    assert not first.loaded() and not second.loaded()
+    assert not journal.needs_compaction()
+    first.symbols[0].name = "Changed"
+    assert not journal.save([first, second])
+    assert not second.loaded()
+    journal.close()
+
+    journal, (first, second) = _journal(file_name, "binary")
+    journal.close()
+    assert first.symbols[0].name == "Changed"
+    assert second.symbols[0].name == "B"
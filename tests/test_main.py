@@ -0,0 +1,14 @@
+# Copyright (c) 2020 Jeffrey A. Webb
+
+import subprocess
+import sys
+
+def test_export_parser_does_not_import_qt():
+    statement = (
+        "import sys\n"
+        "from hildegard.__main__ import create_export_parser\n"
+        "args = create_export_parser().parse_args(['p.hp', '-f', 'png'])\n"
+        "assert args.format == ['png']\n"
+        "assert not any(m.split('.')[0] in ('qtpy', 'PySide2')\n"
+        "               for m in sys.modules)\n")
+    subprocess.run([sys.executable, "-c", statement], check=True)
@@ -0,0 +1,58 @@
+# Copyright (c) 2020 Jeffrey A. Webb
+
+import os
+import threading
+
+import pytest
+
+from helpers import MAP
+import wumps
+from wumps import migrations
+
+# A connection from before endpoints, in a file without a header
+_old_file = b"""\
+- Diagram:
+    name: D
+    symbols:
+      - Block:
+          name: A
+          connectors:
+            - Connector:
+                _id: 1
+                name: Connector
+    connections:
+      - Connection:
+          source: 1
+          sink: 1
+"""
+
+def _check(d):
+    connector = d.symbols[0].connectors[0]
+    assert d.connections[0].source.connector is connector
+    assert d.connections[0].sink.connector is connector
+
+def test_old_file_from_pipe_is_upgraded():
+    read_fd, write_fd = os.pipe()
+    def write():
+        with open(write_fd, "wb") as f:
+            f.write(_old_file)
+    writer = threading.Thread(target=write)
+    writer.start()
+    with open(read_fd, "rb") as f:
+        d, = wumps.load(f, MAP)
+    writer.join()
+    _check(d)
+
+def test_text_pipe_is_rejected():
+    read_fd, write_fd = os.pipe()
+    os.close(write_fd)
+    with open(read_fd) as f:
+        with pytest.raises(ValueError):
+            migrations.file_version(f)
+
+def test_migrations_must_agree(monkeypatch):
+    monkeypatch.setattr(migrations, "_migrations", {})
+    migrations.migration((0, 0), (0, 1))(lambda events: events)
+    migrations.migration((0, 0), (0, 1))(lambda events: events)
+    with pytest.raises(ValueError):
+        migrations.migration((0, 0), (0, 2))(lambda events: events)
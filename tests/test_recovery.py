@@ -0,0 +1,45 @@
+# Copyright (c) 2020 Jeffrey A. Webb
+
+import os
+import tempfile
+
+from helpers import MAP, diagram
+from hildegard.common import Environment
+import wumps
+
+class Incremental_Environment(Environment):
+    _incremental = True
+
+def test_recovered_before_first_save(tmp_path):
+    # The file has no ids, so the journal can not record the changes
+    file_name = str(tmp_path / "project.hp")
+    wumps.save([diagram("Diagram", ["A"])], file_name)
+    env = Incremental_Environment(file_name)
+    assert not env._journal.recording()
+    env.entities()[0].symbols[0].name = "Changed"
+    assert env._write_recovery()
+    recovery = env._recovery_name()
+    assert os.path.exists(recovery)
+
+    env = Incremental_Environment(file_name)
+    assert env._recovered
+    assert env.entities()[0].symbols[0].name == "Changed"
+    env._save()
+    assert not os.path.exists(recovery)
+    env = Incremental_Environment(file_name)
+    assert not env._recovered
+    assert env.entities()[0].symbols[0].name == "Changed"
+
+def test_untitled_recovery(tmp_path):
+    env = Environment([diagram("Diagram", ["A"])])
+    assert env._write_recovery()
+    recovery = env._recovery_name()
+    try:
+        assert os.path.dirname(recovery) == tempfile.gettempdir()
+        assert wumps.load(recovery, MAP)[0].symbols[0].name == "A"
+        env._file_name = str(tmp_path / "project.hp")
+        env._save()
+        assert not os.path.exists(recovery)
+    finally:
+        if os.path.exists(recovery):
+            os.remove(recovery)
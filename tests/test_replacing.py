@@ -0,0 +1,22 @@
+# Copyright (c) 2020 Jeffrey A. Webb
+
+import os
+
+from wumps import base
+
+def test_new_file_mode_follows_umask(tmp_path):
+    file_name = str(tmp_path / "new.hp")
+    with base.replacing(file_name) as f:
+        f.write("[]\n")
+    assert os.stat(file_name).st_mode & 0o777 == 0o666 & ~base._umask
+
+def test_existing_file_mode_is_kept(tmp_path):
+    file_name = str(tmp_path / "old.hp")
+    with open(file_name, "w") as f:
+        f.write("[]\n")
+    os.chmod(file_name, 0o640)
+    with base.replacing(file_name) as f:
+        f.write("- 1\n")
+    assert os.stat(file_name).st_mode & 0o777 == 0o640
+    with open(file_name) as f:
+        assert f.read() == "- 1\n"
@@ -0,0 +1,41 @@
+# Copyright (c) 2020 Jeffrey A. Webb
+
+from hildegard.diagram import Block
+from wumps.undo import Undo_Stack
+
+def _stack(*entities, limit=100000):
+    stack = Undo_Stack(limit=limit)
+    stack.attach(entities)
+    return stack
+
+def test_oldest_commands_are_dropped():
+    block = Block(name="Block")
+    stack = _stack(block, limit=10)
+    try:
+        for i in range(20):
+            block.x = i
+        assert len(stack._undo) == 5
+        while stack.undo():
+            pass
+        assert block.x == 14
+    finally:
+        stack.close()
+
+def test_gesture_ends_lost_command():
+    block = Block(name="Block")
+    stack = _stack(block)
+    try:
+        stack.begin_gesture("Move")
+        block.x = 1
+        # The release was lost, so the next gesture is a new command
+        stack.begin_gesture("Move")
+        block.x = 2
+        stack.end()
+        block.y = 3
+        assert stack.undo() == [(block, "y")]
+        assert stack.undo() == [(block, "x")]
+        assert block.x == 1
+        assert stack.undo() == [(block, "x")]
+        assert block.x == 0
+    finally:
+        stack.close()
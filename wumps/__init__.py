@@ -1,3 +1,11 @@
 # Copyright (c) 2020 Jeffrey A. Webb
 
-from .base import Attribute, Entity, elements, load, save
+from .base import (
+    Attribute, Entity, Id_Table, Lazy_Entity, clone, dump, elements,
+    file_format, load, owner, referrers, replacing, resolve, save, snapshot)
+from .changes import Change_Bus
+from .journal import Journal
+from .migrations import migration, upgrade
+from .directory import Project_Directory
+from .snapshots import Snapshots
+from .undo import Undo_Stack
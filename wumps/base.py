@@ -3,15 +3,264 @@
 import yaml
 
 from collections import OrderedDict
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+import io
+import math
+import os
 import sys
+import time
+import weakref
+
+try:
+    from yaml import CSafeLoader as _C_Safe_Loader
+except ImportError: # PyYAML was built without libyaml
+    _C_Safe_Loader = None
+
+# Change trackers (journals, project directories) registered here are
+# told about every attribute change made through Entity.__setattr__ and
+# __setitem__ and every mutation of an element container that has an
+# owner.
+_trackers = []
+
+# Recorders (undo stacks) are also told before each such change, so
+# that they can keep the value it replaces.
+_recorders = []
+
+# Trackers that follow lazily loaded entities (journals) are told here
+# when a Lazy_Entity is decoded.
+_resolvers = []
+
+def _changed(entity, key):
+    for tracker in _trackers:
+        tracker._changed(entity, key)
+
+def _changing(entity, key):
+    for recorder in _recorders:
+        recorder._changing(entity, key)
+
+def _resolved(item):
+    for resolver in list(_resolvers):
+        resolver._resolved(item)
+
+def _tracked(method, added=None, removed=None, compare=False):
+    # Wraps a container method so that trackers are told about changes
+    # to containers with an owner.  The elements of indexed containers
+    # also get or lose their _owner: added(self, args, size) and
+    # removed(self, args, result) give the elements added and removed
+    # by a call, where size is the length before it, or with
+    # compare=True, the contents before and after the call are
+    # compared.
+    def wrapper(self, *args, **kw):
+        owner = self._owner
+        if owner is None:
+            return method(self, *args, **kw)
+        if _recorders:
+            _changing(*owner)
+        if not self._indexed:
+            result = method(self, *args, **kw)
+        elif compare:
+            before = _elements(self)
+            result = method(self, *args, **kw)
+            after = _elements(self)
+            kept = set(map(id, after))
+            _release(owner, [item for item in before if id(item) not in kept])
+            _adopt(owner, after)
+        else:
+            size = len(self)
+            result = method(self, *args, **kw)
+            if removed is not None:
+                # Elements held more than once keep their owner until
+                # the last one is removed
+                _release(owner, [item for item in removed(self, args, result)
+                                 if item not in self])
+            if added is not None:
+                _adopt(owner, added(self, args, size))
+        if _trackers:
+            _changed(*owner)
+        return result
+    wrapper.__name__ = method.__name__
+    return wrapper
+
+# Attributes declared with indexed=True keep the model navigable
+# backwards.  Entities held by an indexed attribute that is saved with
+# its entity, directly or in an element container, point back to the
+# (entity, attribute name) holding them, see owner().  Entities that
+# are the value of any other indexed attribute keep weak references to
+# the entities referring to them, see referrers().
+
+def _is_owner(item, owner):
+    current = getattr(item, "_owner", None)
+    return (current is not None and current[0] is owner[0] and
+            current[1] == owner[1])
+
+def _adopt(owner, items):
+    for item in items:
+        if isinstance(item, Entity):
+            _owner_slot.__set__(item, owner)
+
+def _release(owner, items):
+    for item in items:
+        if isinstance(item, Entity) and _is_owner(item, owner):
+            _owner_slot.__set__(item, None)
+
+def _elements(container):
+    return list(container.values() if isinstance(container, OrderedDict)
+                else container)
+
+def _appended(self, args, size):
+    return self[size:]
+
+def _argument(self, args, size):
+    return args[-1:]
+
+def _result(self, args, result):
+    return (result,)
+
+def _arguments(self, args, result):
+    return args
+
+# Anonymous element containers keep an index of the identities of
+# their elements, built when membership is first tested, so that "in"
+# and remove() do not compare with every element.  Elements are
+# entities, which are only equal to themselves.
+
+def _count(counts, items):
+    for item in items:
+        key = id(item)
+        counts[key] = counts.get(key, 0) + 1
+
+def _uncount(counts, items):
+    # Returns False if an item was not indexed
+    for item in items:
+        key = id(item)
+        n = counts.get(key)
+        if n is None:
+            return False
+        if n > 1:
+            counts[key] = n - 1
+        else:
+            del counts[key]
+    return True
+
+def _counted(method, added=None, removed=None):
+    # Keeps the identity index up to date, or drops it to be rebuilt
+    # if the change to the elements is not known
+    def wrapper(self, *args, **kw):
+        counts = self._counts
+        if counts is None:
+            return method(self, *args, **kw)
+        if added is None and removed is None:
+            self._counts = None
+            return method(self, *args, **kw)
+        size = len(self)
+        result = method(self, *args, **kw)
+        if removed is not None and not _uncount(
+                counts, removed(self, args, result)):
+            self._counts = None
+        elif added is not None:
+            _count(counts, added(self, args, size))
+        return result
+    wrapper.__name__ = method.__name__
+    return wrapper
+
+def _append(self, item):
+    # The most common mutation, without the generic wrappers
+    owner = self._owner
+    if owner is not None and _recorders:
+        _changing(*owner)
+    list.append(self, item)
+    counts = self._counts
+    if counts is not None:
+        key = id(item)
+        counts[key] = counts.get(key, 0) + 1
+    if owner is not None:
+        if self._indexed and isinstance(item, Entity):
+            _owner_slot.__set__(item, owner)
+        if _trackers:
+            _changed(*owner)
+
+def _identity_only(item):
+    return type(item).__eq__ is object.__eq__
 
 class Anonymous_Elements_Base(list):
-    pass
+    _owner = None # (entity, attribute name), set by trackers
+    _indexed = False # Whether the elements point back to the owner
+    _counts = None # id(element) -> occurrences, built on demand
+    append = _append
+
+    def _index(self):
+        counts = self._counts
+        if counts is None:
+            counts = self._counts = {}
+            _count(counts, self)
+        return counts
+
+    def __contains__(self, item):
+        if id(item) in self._index():
+            return True
+        return not _identity_only(item) and list.__contains__(self, item)
+
+    def remove(self, item):
+        # Elements that are not there are found without a search
+        counts = self._index()
+        if _identity_only(item):
+            if id(item) not in counts:
+                raise ValueError(f"{item!r} is not in list")
+            list.remove(self, item)
+            _uncount(counts, (item,))
+        else:
+            list.remove(self, item)
+            self._counts = None
+
+    def __getstate__(self):
+        # The identity index does not apply to copies
+        state = dict(self.__dict__)
+        state.pop("_counts", None)
+        return state or None
+
+for _name, _added, _removed in (
+        ("__iadd__", _appended, None),
+        ("extend", _appended, None),
+        ("insert", _argument, None),
+        ("pop", None, _result)):
+    setattr(Anonymous_Elements_Base, _name, _tracked(_counted(
+        getattr(list, _name), _added, _removed), _added, _removed))
+
+Anonymous_Elements_Base.remove = _tracked(
+    Anonymous_Elements_Base.remove, removed=_arguments)
+
+for _name in ("reverse", "sort"):
+    setattr(Anonymous_Elements_Base, _name, _tracked(getattr(list, _name)))
+
+for _name in ("__setitem__", "__delitem__", "__imul__", "clear"):
+    setattr(Anonymous_Elements_Base, _name, _tracked(
+        _counted(getattr(list, _name)), compare=True))
 
 class Named_Elements_Base(OrderedDict):
+    _owner = None
+    _indexed = False
+
     def __setitem__(self, key, value):
+        owner = self._owner
+        if owner is not None and _recorders:
+            _changing(*owner)
+        old = self.get(key)
         super().__setitem__(key, value)
         value.name = key
+        if owner is not None:
+            if self._indexed:
+                if old is not value:
+                    _release(owner, (old,))
+                _adopt(owner, (value,))
+            if _trackers:
+                _changed(*owner)
+
+for _name in ("__delitem__", "clear", "pop", "popitem"):
+    setattr(Named_Elements_Base, _name, _tracked(
+        getattr(OrderedDict, _name), compare=True))
+
+Named_Elements_Base.move_to_end = _tracked(OrderedDict.move_to_end)
 
 def elements(element_type=None, attr_name=None, anonymous=False):
     if anonymous:
@@ -34,11 +283,13 @@ def elements(element_type=None, attr_name=None, anonymous=False):
 
 class Attribute:
     def __init__(self, name, type=None, alias=None, aliases=None, save=None,
-                 reference=None, **kw):
+                 reference=None, indexed=None, notify=None, **kw):
         self.name = name
         self.type = type
         self.save = save
         self.reference = reference
+        self.indexed = indexed
+        self.notify = notify # Call entity._notify(name, value) on assignment
         self.aliases = list(aliases) if aliases is not None else []
         if alias is not None:
             self.aliases.append(alias)
@@ -57,25 +308,197 @@ class Attribute:
                 raise TypeError(
                     f"__init__() got an unexpected keyword argument '{key}'")
 
+class _Fixed_Value:
+    # Class-level descriptor for attributes declared with value=...
+    def __init__(self, value):
+        self.value = value
+
+    def __get__(self, entity, entity_type=None):
+        return self.value
+
+    def __set__(self, entity, value):
+        raise AttributeError("attribute value is fixed")
+
+def _fixed_value_setter(entity, value):
+    raise AttributeError("attribute value is fixed")
+
+def _add_referrer(target, name, entity):
+    # _referrers holds (attribute name, weak reference) while there is
+    # only one referrer, then a dict of attribute name -> weak set
+    index = getattr(target, "_referrers", None)
+    if index is None or (index.__class__ is tuple and index[1]() is None):
+        _referrers_slot.__set__(target, (name, weakref.ref(entity)))
+        return
+    if index.__class__ is tuple:
+        if index[0] == name and index[1]() is entity:
+            return
+        index = {index[0]: weakref.WeakSet((index[1](),))}
+        _referrers_slot.__set__(target, index)
+    entities = index.get(name)
+    if entities is None:
+        entities = index[name] = weakref.WeakSet()
+    entities.add(entity)
+
+def _remove_referrer(target, name, entity):
+    index = getattr(target, "_referrers", None)
+    if index.__class__ is tuple:
+        if index[0] == name and index[1]() is entity:
+            _referrers_slot.__set__(target, None)
+    elif index is not None and name in index:
+        index[name].discard(entity)
+
+def _adopt_value(owner, value):
+    if isinstance(value, Entity):
+        _owner_slot.__set__(value, owner)
+    elif isinstance(value, (Anonymous_Elements_Base, Named_Elements_Base)):
+        value._owner = owner
+        if value:
+            _adopt(owner, _elements(value))
+
+def _release_value(owner, value):
+    if isinstance(value, Entity):
+        _release(owner, (value,))
+    elif isinstance(value, (Anonymous_Elements_Base, Named_Elements_Base)):
+        if value._owner is not None and value._owner[0] is owner[0]:
+            value._owner = None
+        _release(owner, _elements(value))
+
+def _indexed_setters(a, slot):
+    # The setter used for assignments, which unindexes the old value,
+    # and the one used by the constructors, where there is none
+    name = a.name
+    get = slot.__get__
+    set = slot.__set__
+    if a.reference is not True and a.save is not False:
+        container = a.type if isinstance(a.type, type) and issubclass(
+            a.type, (Anonymous_Elements_Base, Named_Elements_Base)) else None
+        def init_setter(entity, value):
+            set(entity, value)
+            if value is not None:
+                _adopt_value((entity, name), value)
+        def setter(entity, value):
+            if (container is not None and value is not None and
+                not isinstance(value, container)):
+                # Plain lists and dicts become element containers, as
+                # in the constructors
+                value = container(value)
+            old = get(entity)
+            set(entity, value)
+            if old is not value:
+                owner = (entity, name)
+                if old is not None:
+                    _release_value(owner, old)
+                if value is not None:
+                    _adopt_value(owner, value)
+    else:
+        def init_setter(entity, value):
+            set(entity, value)
+            if isinstance(value, Entity):
+                _add_referrer(value, name, entity)
+        def setter(entity, value):
+            old = get(entity)
+            set(entity, value)
+            if old is not value:
+                if isinstance(old, Entity):
+                    _remove_referrer(old, name, entity)
+                if isinstance(value, Entity):
+                    _add_referrer(value, name, entity)
+    return init_setter, setter
+
+def _notifying_setter(name, set):
+    # Constructors do not notify
+    def setter(entity, value):
+        set(entity, value)
+        entity._notify(name, value)
+    return setter
+
 class Entity_Type(type):
-    def __new__(cls, *args, **kw):
-        et = super().__new__(cls, *args, **kw)
-        et._attr_info_list = list(et._attr_info_list) if hasattr(
-            et, "_attr_info_list") else list()
-        et._attr_info = dict(et._attr_info) if hasattr(
-            et, "_attr_info") else dict()
-        for a in et._attributes:
-            if a.name in et._attr_info:
-                cls._override(et, a)
+    # Attribute values are stored in __slots__ named after the
+    # attributes, so reading an attribute is a plain slot access.
+    # Aliases are bound to the same slot when the class is created.
+    def __new__(cls, name, bases, namespace, **kw):
+        base = next((b for b in bases if isinstance(b, Entity_Type)), None)
+        if base is None:
+            attr_info_list = list()
+            attr_info = dict()
+            slots = ["__weakref__", "_owner", "_referrers"]
+        else:
+            attr_info_list = list(base._attr_info_list)
+            attr_info = dict(base._attr_info)
+            slots = []
+        declared_slots = namespace.get("__slots__", ())
+        if isinstance(declared_slots, str):
+            declared_slots = (declared_slots,)
+        slots.extend(declared_slots)
+        for a in namespace.get("_attributes", ()):
+            if a.name in attr_info:
+                cls._override(attr_info_list, attr_info, a)
             else:
-                et._attr_info_list.append(a)
-                et._attr_info[a.name] = a
+                attr_info_list.append(a)
+                attr_info[a.name] = a
                 for alias in a.aliases:
-                    et._attr_info[alias] = a
+                    attr_info[alias] = a
+                if not a.fixed_value:
+                    slots.append(a.name)
+        namespace = dict(namespace)
+        namespace["__slots__"] = tuple(slots)
+        et = super().__new__(cls, name, bases, namespace, **kw)
+        et._attr_info_list = attr_info_list
+        et._attr_info = attr_info
+        et._slots = {}
+        et._setters = {}
+        et._init_setters = {} # Used by the constructors
+        for a in attr_info_list:
+            if a.fixed_value:
+                continue
+            for t in et.__mro__:
+                if a.name in t.__dict__:
+                    et._slots[a.name] = t.__dict__[a.name]
+                    break
+        for a in attr_info_list:
+            if a.fixed_value:
+                continue
+            slot = et._slots[a.name]
+            if a.indexed:
+                (et._init_setters[a.name],
+                 et._setters[a.name]) = _indexed_setters(a, slot)
+                if isinstance(a.type, type) and issubclass(
+                        a.type, (Anonymous_Elements_Base,
+                                 Named_Elements_Base)):
+                    a.type._indexed = True
+            else:
+                et._init_setters[a.name] = et._setters[a.name] = slot.__set__
+            if a.notify:
+                et._setters[a.name] = _notifying_setter(
+                    a.name, et._setters[a.name])
+        for key, a in attr_info.items():
+            if a.fixed_value:
+                if not isinstance(getattr(et, key, None), _Fixed_Value):
+                    setattr(et, key, _Fixed_Value(a.value))
+                et._setters[key] = _fixed_value_setter
+            else:
+                slot = et._slots[a.name]
+                if key != a.name and key not in et.__dict__:
+                    setattr(et, key, slot)
+                et._setters[key] = et._setters[a.name]
+        et._init = _compile_init(et)
+        et._build = staticmethod(_compile_build(et))
+        if ("__init__" not in namespace and
+            getattr(et.__init__, "_wumps_init", False)):
+            # Nothing in between defines its own constructor
+            et.__init__ = et._init
+        et._reference_attrs = tuple(
+            a.name for a in et._attr_info_list if a.reference is True)
+        et._nested_attrs = tuple(
+            a.name for a in et._attr_info_list
+            if a.reference is not True and a.save is not False)
+        et._copied_attrs = tuple(
+            a.name for a in et._attr_info_list if not a.fixed_value and (
+                a.reference is True or a.save is not False))
         return et
 
-    def _override(et, new_a):
-        existing_a = et._attr_info[new_a.name]
+    def _override(attr_info_list, attr_info, new_a):
+        existing_a = attr_info[new_a.name]
         if existing_a.type is not None:
             if new_a.type is None:
                 new_a.type = existing_a.type
@@ -92,11 +515,24 @@ class Entity_Type(type):
             else:
                 raise Exception(
                     "attribute reference has already been specified")
+        if existing_a.indexed is not None:
+            if new_a.indexed is None:
+                new_a.indexed = existing_a.indexed
+            else:
+                raise Exception(
+                    "attribute indexed has already been specified")
+        if existing_a.notify is not None:
+            if new_a.notify is None:
+                new_a.notify = existing_a.notify
+            else:
+                raise Exception(
+                    "attribute notify has already been specified")
         if existing_a.fixed_value:
             if new_a.fixed_value:
                 raise Exception("attribute value has already been specified")
             else:
                 new_a.fixed_value = existing_a.fixed_value
+                new_a.value = existing_a.value
         if existing_a.use_default and not new_a.use_default:
             new_a.use_default = True
             new_a.default = existing_a.default
@@ -105,88 +541,398 @@ class Entity_Type(type):
                 new_a.aliases.remove(alias)
             new_a.aliases.insert(0,alias)
         # Replace existing attribute with new one
-        old_index = et._attr_info_list.index(existing_a)
-        et._attr_info_list.insert(old_index, new_a)
-        et._attr_info_list.remove(existing_a)
-        et._attr_info[new_a.name] = new_a
+        old_index = attr_info_list.index(existing_a)
+        attr_info_list.insert(old_index, new_a)
+        attr_info_list.remove(existing_a)
+        attr_info[new_a.name] = new_a
         for alias in new_a.aliases:
-            et._attr_info[alias] = new_a
+            attr_info[alias] = new_a
+
+class _Attrs_View(MutableMapping):
+    # Dict-like view of the attribute values of an entity, for code
+    # written against the former per-instance _attrs dict.
+    __slots__ = ("_entity",)
+
+    def __init__(self, entity):
+        self._entity = entity
+
+    def _check(self, name):
+        a = self._entity._attr_info.get(name)
+        if a is None or a.name != name:
+            raise KeyError(name)
+        return a
+
+    def __getitem__(self, name):
+        self._check(name)
+        return getattr(self._entity, name)
+
+    def __setitem__(self, name, value):
+        if self._check(name).fixed_value:
+            raise AttributeError("attribute value is fixed")
+        self._entity._setters[name](self._entity, value)
+
+    def __delitem__(self, name):
+        raise TypeError("entity attributes cannot be deleted")
+
+    def __iter__(self):
+        return (a.name for a in self._entity._attr_info_list)
+
+    def __len__(self):
+        return len(self._entity._attr_info_list)
+
+_missing = object()
+
+def _coerce(t, value):
+    # Keyword argument conversion for attributes of non-container type
+    if isinstance(value, Entity):
+        return value
+    if isinstance(value, list) and value and isinstance(value[0], Entity):
+        return value[0]
+    return t(value)
+
+def _normalize_kw(entity_type, kw):
+    # Map aliases to attribute names and drop fixed-value attributes
+    attr_info = entity_type._attr_info
+    result = {}
+    for key, value in kw.items():
+        a = attr_info[key]
+        if not a.fixed_value:
+            result[a.name] = value
+    return result
+
+def _compile(entity_type, lines, args, values):
+    # Defines the function in lines (the body of make()) with the
+    # given names bound to values.
+    source = "\n".join([f"def make({', '.join(args)}):"] + lines)
+    namespace = {}
+    exec(source, globals(), namespace)
+    return namespace["make"](*values)
+
+def _init_args(entity_type):
+    # Names and values shared by the generated functions, and the
+    # (index, attribute, default expression) of each stored attribute
+    args = ["entity_type", "post_init"]
+    values = [entity_type, getattr(entity_type, "_post_init", None)]
+    attrs = []
+    for i, a in enumerate(entity_type._attr_info_list):
+        if a.fixed_value:
+            continue
+        args.extend((f"s_{i}", f"t_{i}", f"d_{i}"))
+        values.extend((entity_type._init_setters[a.name], a.type, a.default))
+        if a.use_default:
+            default = f"d_{i}"
+        elif a.type is not None:
+            default = f"t_{i}()"
+        else:
+            default = "None"
+        attrs.append((i, a, default))
+    return args, values, attrs
+
+def _compile_init(entity_type):
+    # Generates a constructor for entity_type with the attribute
+    # defaults, alias mapping and argument conversions worked out up
+    # front, instead of rediscovering them on every construction.
+    args, values, attrs = _init_args(entity_type)
+    args.append("names")
+    values.append(frozenset(a.name for i, a, default in attrs))
+    defaults = []
+    kw_lines = []
+    for i, a, default in attrs:
+        defaults.append(f"            s_{i}(self, {default})")
+        kw_lines.append(f"            v = kw.get({a.name!r}, _missing)")
+        kw_lines.append("            if v is _missing:")
+        kw_lines.append(f"                s_{i}(self, {default})")
+        if a.type is None:
+            kw_lines.append("            else:")
+            kw_lines.append(f"                s_{i}(self, v)")
+        elif issubclass(a.type, (list, OrderedDict)):
+            kw_lines.append("            elif isinstance(v, Entity):")
+            kw_lines.append(f"                s_{i}(self, v)")
+            kw_lines.append("            else:")
+            kw_lines.append(f"                s_{i}(self, t_{i}(v))")
+        else:
+            kw_lines.append("            else:")
+            kw_lines.append(f"                if v.__class__ is not t_{i}:")
+            kw_lines.append(f"                    v = _coerce(t_{i}, v)")
+            kw_lines.append(f"                s_{i}(self, v)")
+    lines = (
+        ["    def __init__(self, *args, **kw):",
+         "        if kw:",
+         "            if not names.issuperset(kw):",
+         "                kw = _normalize_kw(entity_type, kw)"] +
+        kw_lines +
+        ["        else:"] +
+        (defaults or ["            pass"]))
+    if values[1] is not None:
+        lines.append("        post_init(self)")
+    lines.append("    return __init__")
+    init = _compile(entity_type, lines, args, values)
+    init.__qualname__ = f"{entity_type.__qualname__}.__init__"
+    init._wumps_init = True
+    return init
+
+def _compile_build(entity_type):
+    # Generates the trusted constructor used by the loaders.  It takes
+    # a dict of already converted values keyed by attribute name and
+    # does no alias mapping, conversion or validation.
+    args, values, attrs = _init_args(entity_type)
+    args.append("new")
+    values.append(object.__new__)
+    lines = ["    def _build(kw):",
+             "        self = new(entity_type)"]
+    for i, a, default in attrs:
+        lines.append(f"        v = kw.get({a.name!r}, _missing)")
+        lines.append(f"        s_{i}(self, {default} if v is _missing else v)")
+    if values[1] is not None:
+        lines.append("        post_init(self)")
+    lines.append("        return self")
+    lines.append("    return _build")
+    build = _compile(entity_type, lines, args, values)
+    build.__qualname__ = f"{entity_type.__qualname__}._build"
+    return build
 
 class Entity(metaclass=Entity_Type):
     _attributes = (
         Attribute("name", str, default=""),
     )
+    _shared = False # Kept in the shared file of a project directory
     def __init__(self, *args, **kw):
-        self._attrs = {}
-        for a in self._attr_info_list:
-            self._attrs[a.name] = (
-                a.default if a.use_default else a.type() if
-                a.type is not None else None)
-        for key, value in kw.items():
-            a = self._attr_info[key]
-            is_entity = False
-            if isinstance(value, Entity):
-                is_entity = True
-            elif isinstance(value, list) and value:
-                if isinstance(value[0], Entity):
-                    if not issubclass(a.type, list):
-                        if not issubclass(a.type, OrderedDict):
-                            is_entity = True
-            if (a.type is not None and
-                not is_entity): # no Entity copy constructor yet
-                value = a.type(value)
-            elif (not issubclass(a.type, list) and
-                  not issubclass(a.type, OrderedDict) and
-                  isinstance(value, list) and value):
-                value = value[0]
-            self._attrs[a.name] = value
+        self._init(*args, **kw)
+    __init__._wumps_init = True
+
+    @property
+    def _attrs(self):
+        return _Attrs_View(self)
+
+    def __deepcopy__(self, memo):
+        return clone(self, memo)
 
     def __getitem__(self, key):
-        if self._attr_info[key].fixed_value:
-            return self._attr_info[key].value
-        unaliased_key = self._attr_info[key].name
-        return self._attrs[unaliased_key]
+        if key not in self._attr_info:
+            raise KeyError(key)
+        return getattr(self, key)
 
     def __setitem__(self, key, value):
-        unaliased_key = self._attr_info[key].name
-        if not unaliased_key in self._attrs:
-            raise KeyError(key)
-        if self._attr_info[key].fixed_value:
-            raise AttributeError("attribute value is fixed")
-        self._attrs[unaliased_key] = value
+        try:
+            setter = self._setters[key]
+        except KeyError:
+            raise KeyError(key) from None
+        if _recorders:
+            _changing(self, key)
+        setter(self, value)
+        if _trackers:
+            _changed(self, key)
+
+    def __setattr__(self, key, value):
+        setter = self._setters.get(key)
+        if setter is None:
+            object.__setattr__(self, key, value)
+        else:
+            if _recorders:
+                _changing(self, key)
+            setter(self, value)
+            if _trackers:
+                _changed(self, key)
+
+_owner_slot = Entity.__dict__["_owner"]
+_referrers_slot = Entity.__dict__["_referrers"]
+
+def owner(entity):
+    # The (entity, attribute name) holding entity through an indexed
+    # attribute, or None
+    return getattr(entity, "_owner", None)
+
+def referrers(entity, name):
+    # The entities whose indexed attribute name refers to entity
+    index = getattr(entity, "_referrers", None)
+    if index.__class__ is tuple:
+        referrer = index[1]() if index[0] == name else None
+        return [] if referrer is None else [referrer]
+    if index is None or name not in index:
+        return []
+    return list(index[name])
+
+class Lazy_Entity:
+    # Stand-in for a top-level entity that has not been decoded yet.
+    # Attribute access decodes it; entity_type and name are known from
+    # the file index without decoding.
+    __slots__ = ("_loader", "_record", "_entity", "entity_type", "name")
+
+    def __init__(self, loader, record, entity_type, name):
+        object.__setattr__(self, "_loader", loader)
+        object.__setattr__(self, "_record", record)
+        object.__setattr__(self, "_entity", None)
+        object.__setattr__(self, "entity_type", entity_type)
+        object.__setattr__(self, "name", name)
+
+    def loaded(self):
+        return self._entity is not None
+
+    def resolve(self):
+        if self._entity is None:
+            self._loader.load(self._record)
+        return self._entity
 
     def __getattr__(self, key):
-        return self.__getitem__(key)
+        return getattr(self.resolve(), key)
 
     def __setattr__(self, key, value):
-        if "_attrs" in self.__dict__ and key in self._attrs:
-            self.__setitem__(key, value)
-        else:
-            super().__setattr__(key, value)
+        setattr(self.resolve(), key, value)
+
+    def __getitem__(self, key):
+        return self.resolve()[key]
+
+    def __setitem__(self, key, value):
+        self.resolve()[key] = value
+
+    def __eq__(self, other):
+        return other is self or (
+            self._entity is not None and other is self._entity)
+
+    def __hash__(self):
+        return object.__hash__(self)
+
+    def __repr__(self):
+        state = "loaded" if self._entity is not None else "not loaded"
+        return (f"<Lazy_Entity {self.entity_type.__name__} "
+                f"{self.name!r} ({state})>")
+
+def resolve(item):
+    return item.resolve() if isinstance(item, Lazy_Entity) else item
+
+def _resolve_all(item):
+    if isinstance(item, list) and any(
+            isinstance(i, Lazy_Entity) for i in item):
+        return [resolve(i) for i in item]
+    return resolve(item)
+
+class Id_Table:
+    # Ids of referenced entities that are kept from load to save, so
+    # that saving does not renumber the references of a project.  New
+    # ids are given out in increasing order and are never reused.
+    # Entities are held weakly, so deleted ones can not be looked up.
+    def __init__(self):
+        self._numbers = weakref.WeakKeyDictionary() # entity -> id
+        self._entities = weakref.WeakValueDictionary() # id -> entity
+        self.next_id = 1
+
+    def __contains__(self, entity):
+        return entity in self._numbers
+
+    def __len__(self):
+        return len(self._numbers)
+
+    def get(self, number, default=None):
+        return self._entities.get(number, default)
+
+    def items(self):
+        # (id, entity) pairs
+        return self._entities.items()
+
+    def define(self, entity, number):
+        old = self._numbers.get(entity)
+        if old is not None and old != number:
+            del self._entities[old]
+        self._numbers[entity] = number
+        self._entities[number] = entity
+        if number >= self.next_id:
+            self.next_id = number + 1
+
+    def id(self, entity):
+        number = self._numbers.get(entity)
+        if number is None:
+            number = self._numbers[entity] = self.next_id
+            self._entities[number] = entity
+            self.next_id += 1
+        return number
+
+def _walk(items, visit, own=False):
+    # Calls visit(entity) for the entities reachable from items through
+    # their nested attributes, parents first and in the order in which
+    # they are stored.  The children of entities for which visit()
+    # returns False are skipped.  With own=True, element containers
+    # are marked as owned by their entities, so that their mutations
+    # are reported.
+    stack = list(items)
+    stack.reverse()
+    pop = stack.pop
+    while stack:
+        item = pop()
+        if isinstance(item, Entity):
+            if visit(item) is False:
+                continue
+            children = []
+            for name in item._nested_attrs:
+                value = getattr(item, name)
+                if isinstance(value, (Entity, list)):
+                    children.append(value)
+                elif isinstance(value, OrderedDict):
+                    children.extend(value.values())
+                if own and isinstance(value, (Anonymous_Elements_Base,
+                                              Named_Elements_Base)):
+                    value._owner = (item, name)
+            children.reverse()
+            stack.extend(children)
+        elif isinstance(item, list):
+            stack.extend(reversed(item))
+
+class Reference_Index:
+    # Identity-keyed set of the entities that are referenced from
+    # within an entity graph.  Referenced entities are numbered in the
+    # order in which their ids are first requested, so that saving the
+    # same graph twice produces the same ids.  Numbers already in the
+    # given Id_Table are kept.
+    def __init__(self, item=None, ids=None):
+        self._entries = {}
+        self.ids = Id_Table() if ids is None else ids
+        self.entity_count = 0
+        if item is not None:
+            self.add(item)
+
+    def add(self, item, added=None):
+        # Referenced entities not seen before are appended to added
+        entries = self._entries
+        count = 0
+        def visit(entity):
+            nonlocal count
+            count += 1
+            for name in type(entity)._reference_attrs:
+                value = getattr(entity, name)
+                if value is not None and id(value) not in entries:
+                    entries[id(value)] = value
+                    if added is not None:
+                        added.append(value)
+        _walk([item], visit)
+        self.entity_count += count
+        return self
+
+    def __contains__(self, entity):
+        return id(entity) in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __iter__(self):
+        return iter(self._entries.values())
+
+    def define(self, entity, number):
+        # Gives entity a fixed id, such as the one it was loaded with
+        self._entries[id(entity)] = entity
+        self.ids.define(entity, number)
+
+    def prune(self, keep):
+        # Forgets the entities that are not in keep
+        self._entries = {key: entity for key, entity in self._entries.items()
+                         if entity in keep}
+
+    def id(self, entity):
+        return self.ids.id(entity)
 
-def _find_referenced_entities(item, referenced_items):
-    if isinstance(item, Entity):
-        for name, value in item._attrs.items():
-            if type(item)._attr_info[name].reference is True:
-                referenced_items.append(value)
-            if isinstance(value, Entity):
-                _find_referenced_entities(value, referenced_items)
-            elif isinstance(value, list):
-                for list_item in value:
-                    _find_referenced_entities(list_item, referenced_items)
-            elif isinstance(value, OrderedDict):
-                for subname, subvalue in value.items():
-                    _find_referenced_entities(subvalue, referenced_items)
-    elif isinstance(item, list):
-        for subitem in item:
-            _find_referenced_entities(subitem, referenced_items)
-    return referenced_items
-    
 def save_to(item, level=0, file=None, found=None):
     top = False
     if found is None:
         top = True
-        found = _find_referenced_entities(item, [])
+        found = Reference_Index(item)
     space = "  "
     if file is None:
         file = sys.stdout
@@ -195,12 +941,12 @@ def save_to(item, level=0, file=None, found=None):
     if isinstance(item, Entity):
         file.write(f"\n{space*level}- {item.__class__.__name__}:\n")
         if item in found:
-            file.write(f"{space*(level+2)}_id: {id(item)}\n")
+            file.write(f"{space*(level+2)}_id: {found.id(item)}\n")
         for name, value in item._attrs.items():
             if value is None or value is "":
                 pass
             elif type(item)._attr_info[name].reference is True:
-                file.write(f"{space*(level+2)}{name}: {id(value)}\n")
+                file.write(f"{space*(level+2)}{name}: {found.id(value)}\n")
             elif type(item)._attr_info[name].save is not False:
                 if isinstance(value, list) and not value:
                     continue # Don't write out empty list items
@@ -218,44 +964,508 @@ def save_to(item, level=0, file=None, found=None):
     else:
         file.write(f" {item}\n")
 
-def save(item, file_name=None):
-    f = None
-    if file_name:
+class Buffered_Writer:
+    def __init__(self, file, buffer_size=65536):
+        self.file = file
+        self.buffer_size = buffer_size
+        self._chunks = []
+        self._size = 0
+
+    def write(self, text):
+        self._chunks.append(text)
+        self._size += len(text)
+        if self._size >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self._chunks:
+            self.file.write("".join(self._chunks))
+            self._chunks = []
+            self._size = 0
+
+_header = '# {format: "yaml", major_version: 0, minor_version: 1}'
+
+def _dump_plan(entity_type, indent, attr_indent):
+    # Precomputed text for writing entities of one type at one level
+    attrs = []
+    for a in entity_type._attr_info_list:
+        if a.reference is True:
+            attrs.append((a.name, True, f"{attr_indent}{a.name}:"))
+        elif a.save is not False:
+            attrs.append((a.name, False, f"{attr_indent}{a.name}:"))
+    return (f"\n{indent}- {entity_type.__name__}:\n",
+            f"{attr_indent}_id:", attrs)
+
+def dump(item, file=None, buffer_size=65536, progress=None,
+         references=None, ids=None):
+    # Iterative equivalent of save_to() that batches the output into
+    # large writes.  Pending work is kept on an explicit stack of
+    # (item, level) pairs, where a level of None marks literal text.
+    # progress(done, total) is called every few thousand entities.
+    # A Reference_Index shared by several files gives ids that are
+    # unique across them, and an Id_Table gives ids that are kept from
+    # one save to the next.
+    item = _resolve_all(item)
+    if references is None:
+        references = Reference_Index(item, ids)
+    total = references.entity_count
+    done = 0
+    space = "  "
+    indents = [space*level for level in range(32)]
+    plans = {}
+    if file is None:
+        file = sys.stdout
+    out = Buffered_Writer(file, buffer_size)
+    write = out.write
+    write(_header)
+    stack = [(item, 0)]
+    pop = stack.pop
+    while stack:
+        item, level = pop()
+        if level is None:
+            write(item)
+            continue
+        if isinstance(item, Entity):
+            done += 1
+            if progress is not None and not done & 4095:
+                progress(done, total)
+            plan = plans.get((item.__class__, level))
+            if plan is None:
+                while len(indents) <= level + 2:
+                    indents.append(space*len(indents))
+                plan = plans[(item.__class__, level)] = _dump_plan(
+                    item.__class__, indents[level], indents[level+2])
+            head, id_prefix, attrs = plan
+            text = [head]
+            if item in references:
+                text.append(f"{id_prefix} {references.id(item)}\n")
+            pending = []
+            for name, reference, prefix in attrs:
+                value = getattr(item, name)
+                if value is None or value == "":
+                    continue
+                if reference:
+                    text.append(f"{prefix} {references.id(value)}\n")
+                elif isinstance(value, (Entity, list, OrderedDict)):
+                    if not isinstance(value, Entity) and not value:
+                        continue # Don't write out empty containers
+                    text.append(prefix)
+                    pending.append(("".join(text), None))
+                    pending.append((value, level+3))
+                    text = []
+                else:
+                    text.append(f"{prefix} {value}\n")
+            if pending:
+                if text:
+                    pending.append(("".join(text), None))
+                pending.reverse()
+                stack.extend(pending)
+            else:
+                write("".join(text))
+        elif isinstance(item, list):
+            if not item:
+                write(" []\n")
+            else:
+                stack.extend([(subitem, level) for subitem in reversed(item)])
+        elif isinstance(item, OrderedDict):
+            stack.extend(
+                [(subitem, level) for subitem in reversed(item.values())])
+        else:
+            write(f" {item}\n")
+    out.flush()
+    if progress is not None:
+        progress(total, total)
+
+# Read once on import, as it can only be read by setting it, which
+# would race with threads creating files
+_umask = os.umask(0)
+os.umask(_umask)
+
+@contextmanager
+def replacing(file_name, mode="w"):
+    # Opens a temporary file next to file_name that replaces it when
+    # the block completes, so the file is never left half written.
+    import tempfile # Slow to import, and only needed for writing
+    directory = os.path.dirname(os.path.abspath(file_name))
+    fd, temp_name = tempfile.mkstemp(
+        prefix="." + os.path.basename(file_name) + ".", dir=directory)
+    try:
+        try:
+            os.chmod(temp_name, os.stat(file_name).st_mode & 0o7777)
+        except FileNotFoundError:
+            os.chmod(temp_name, 0o666 & ~_umask)
+        with os.fdopen(fd, mode) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_name, file_name)
+    except BaseException:
+        if os.path.exists(temp_name):
+            os.remove(temp_name)
+        raise
+
+def save(item, file_name=None, format="yaml", progress=None, ids=None,
+         shared_types=None, references=None):
+    # shared_types are kept in the shared file of a project directory.
+    # A Reference_Index given as references sets the entities that are
+    # written with ids.
+    if format == "binary":
+        from . import binary
+        print(f"saving to file: {file_name}")
+        binary.save(item, file_name, progress=progress, ids=ids,
+                    references=references)
+    elif format == "directory":
+        from . import directory
+        print(f"saving to directory: {file_name}")
+        directory.save(
+            item, file_name, ids=ids, shared_types=shared_types)
+    elif format != "yaml":
+        raise ValueError(f"unknown wumps format: {format}")
+    elif file_name:
         print(f"saving to file: {file_name}")
-        f = open(file_name, "w")
-    save_to(item, file=f)
-    if file_name:
-        f.close()
+        with replacing(file_name) as f:
+            dump(item, file=f, progress=progress, ids=ids,
+                 references=references)
+    else:
+        dump(item, progress=progress, ids=ids, references=references)
+
+def _copy_value(value, copy):
+    # Copy of the lists and element containers in value, with copy(e)
+    # in place of each entity e
+    if isinstance(value, Entity):
+        return copy(value)
+    elif isinstance(value, OrderedDict):
+        result = value.__class__()
+        for key, subvalue in value.items():
+            # Bypass Named_Elements_Base.__setitem__
+            OrderedDict.__setitem__(result, key, _copy_value(subvalue, copy))
+        return result
+    elif isinstance(value, list):
+        return value.__class__([_copy_value(v, copy) for v in value])
+    return value
+
+def snapshot(item, ids=None, copy_ids=None):
+    # Copy of the saved attributes of an entity graph, which can be
+    # written out while the original is being changed.  References
+    # lead to the copies of their targets.  If Id_Tables are given,
+    # referenced entities are given ids in ids first, and their copies
+    # are given the same ids in copy_ids.
+    item = _resolve_all(item)
+    if ids is not None:
+        for entity in Reference_Index(item, ids):
+            ids.id(entity)
+    copies = {}
+    pending = []
+    def copy(value):
+        entry = copies.get(id(value))
+        if entry is None:
+            entry = copies[id(value)] = (
+                value, value.__class__.__new__(value.__class__))
+            pending.append(entry)
+        return entry[1]
+    result = _copy_value(item, copy)
+    while pending:
+        entity, entity_copy = pending.pop()
+        slots = entity._slots
+        for name in entity._copied_attrs:
+            slots[name].__set__(
+                entity_copy, _copy_value(getattr(entity, name), copy))
+    if copy_ids is not None:
+        copy_ids.next_id = max(copy_ids.next_id, ids.next_id)
+        for entity, entity_copy in copies.values():
+            if entity in ids:
+                copy_ids.define(entity_copy, ids.id(entity))
+    return result
+
+# Clones are made like loaded entities: saved values are cloned, or
+# shared if they cannot change.  Unsaved entities are shared, and other
+# unsaved values start as in a new entity.  References to entities
+# inside the cloned graph lead to their clones, and others are kept.
+
+_clone_functions = {}
+
+_immutable_types = (str, int, float, bool, type(None))
+
+def _compile_clone(entity_type):
+    args, values, attrs = _init_args(entity_type)
+    args.extend(("new", "clone_entity", "clone_value", "set_item"))
+    values.extend((object.__new__, _clone_entity, _clone_value,
+                   OrderedDict.__setitem__))
+    lines = ["    def _clone(entity, copies, fixups):",
+             "        self = new(entity_type)",
+             "        copies[id(entity)] = self"]
+    for i, a, default in attrs:
+        args.append(f"g_{i}")
+        values.append(entity_type._slots[a.name].__get__)
+        if a.reference is True:
+            lines.append(f"        v = g_{i}(entity)")
+            lines.append(f"        s_{i}(self, None)")
+            lines.append("        if v is not None:")
+            lines.append(f"            fixups.append((self, s_{i}, v))")
+        elif a.save is False:
+            # Entities such as the subject of a view are shared, and
+            # other values, such as widgets, start from the default
+            lines.append(f"        v = g_{i}(entity)")
+            lines.append("        if (v is not None and "
+                         "not isinstance(v, Entity)):")
+            lines.append(f"            v = {default}")
+            lines.append(f"        s_{i}(self, v)")
+        elif (isinstance(a.type, type) and
+              issubclass(a.type, _immutable_types)):
+            lines.append(f"        s_{i}(self, g_{i}(entity))")
+        elif _is_entity_type(a.type):
+            lines.append(f"        v = g_{i}(entity)")
+            lines.append("        if v is not None:")
+            lines.append("            v = clone_entity(v, copies, fixups)")
+            lines.append(f"        s_{i}(self, v)")
+        elif (_is_entity_type(getattr(a.type, "_element_type", None)) and
+              issubclass(a.type, Anonymous_Elements_Base)):
+            lines.append(f"        s_{i}(self, t_{i}([clone_entity(e, copies, "
+                         f"fixups) for e in g_{i}(entity)]))")
+        elif (_is_entity_type(getattr(a.type, "_element_type", None)) and
+              issubclass(a.type, Named_Elements_Base)):
+            lines.append(f"        v = t_{i}()")
+            lines.append(f"        for key, e in g_{i}(entity).items():")
+            lines.append("            set_item(v, key, clone_entity(e, copies, "
+                         "fixups))")
+            lines.append(f"        s_{i}(self, v)")
+        else:
+            lines.append(f"        s_{i}(self, clone_value(g_{i}(entity), "
+                         "copies, fixups))")
+    if values[1] is not None:
+        lines.append("        post_init(self)")
+    lines.append("        return self")
+    lines.append("    return _clone")
+    function = _compile(entity_type, lines, args, values)
+    _clone_functions[entity_type] = function
+    return function
+
+def _is_entity_type(t):
+    return isinstance(t, type) and issubclass(t, Entity)
+
+def _clone_entity(entity, copies, fixups):
+    entity_copy = copies.get(id(entity))
+    if entity_copy is None:
+        function = _clone_functions.get(entity.__class__)
+        if function is None:
+            function = _compile_clone(entity.__class__)
+        entity_copy = function(entity, copies, fixups)
+    return entity_copy
+
+def _clone_value(value, copies, fixups):
+    return _copy_value(
+        value, lambda entity: _clone_entity(entity, copies, fixups))
+
+def clone(item, copies=None):
+    # Copy of an entity, or a list of entities, that can be edited
+    # independently of the original.  copies maps id(original) to the
+    # clone of each entity cloned, as in copy.deepcopy()'s memo.
+    if copies is None:
+        copies = {}
+    fixups = []
+    result = _clone_value(_resolve_all(item), copies, fixups)
+    for entity_copy, set, target in fixups:
+        set(entity_copy, copies.get(id(target), target))
+    return result
     
-def _load_entities(tree, map, ids):
+_ID = 0
+_REF = 1
+_SCALAR = 2
+_SINGLE = 3
+_ANONYMOUS = 4
+_NAMED = 5
+_RAW = 6
+_SKIP = 7
+
+_load_plans = {}
+
+def _load_plan(entity_type):
+    # Maps each key that may appear in a saved entity of entity_type
+    # to (attribute name, decoding kind, attribute type).
+    plan = {"_id": (None, _ID, None)}
+    for key, a in entity_type._attr_info.items():
+        t = a.type
+        if a.fixed_value:
+            kind = _SKIP
+        elif a.reference is True:
+            kind = _REF
+        elif t is None:
+            kind = _RAW
+        elif issubclass(t, OrderedDict):
+            kind = _NAMED
+        elif issubclass(t, list):
+            kind = _ANONYMOUS
+        elif issubclass(t, Entity):
+            kind = _SINGLE
+        else:
+            kind = _SCALAR
+        plan[key] = (a.name, kind, t)
+    _load_plans[entity_type] = plan
+    return plan
+
+class Intern_Table:
+    # Shares equal strings and floats between the entities being
+    # loaded.  Once max_size different values are held, values not in
+    # the table are kept as they are.
+    def __init__(self, max_size=1<<16):
+        self.max_size = max_size
+        self.hits = 0
+        self.saved_bytes = 0
+        self._values = {}
+
+    def __call__(self, value):
+        if value.__class__ is float:
+            if value == 0.0 and math.copysign(1.0, value) < 0.0:
+                return value # Equal to 0.0, but not the same value
+            if value != value:
+                return value # NaN, which is not equal to itself
+        elif value.__class__ is not str:
+            return value
+        found = self._values.get(value)
+        if found is None:
+            if len(self._values) < self.max_size:
+                self._values[value] = value
+            return value
+        if found is not value:
+            self.hits += 1
+            self.saved_bytes += sys.getsizeof(value)
+        return found
+
+    def clear(self):
+        self._values = {}
+
+def _load_entities(tree, map, ids, fixups=None, intern=None):
+    # References to ids that are not known yet are added to fixups as
+    # (entity, attribute name, id) if it is given.  Scalar values are
+    # passed through intern if it is given.
     entities = []
     for item in tree:
-        entity_type_name = list(item.keys())[0]
-        entity_type = map[entity_type_name]
-        value = item[entity_type_name]
-        attrs = {}
+        for type_name, values in item.items():
+            break
+        entity_type = map[type_name]
+        plan = _load_plans.get(entity_type)
+        if plan is None:
+            plan = _load_plan(entity_type)
+        kw = {}
         entity_id = None
-        for a_name, a_value in value.items():
-            if a_name == "_id":
-                entity_id = a_value
-                continue
-            if isinstance(a_value, list):
-                attrs[a_name] = _load_entities(a_value, map, ids)
-            elif isinstance(a_value, dict):
-                pass
-            else:
-                if entity_type._attr_info[a_name].reference is True:
-                    attrs[a_name] = ids[a_value]
+        unresolved = None
+        if values:
+            for key, value in values.items():
+                name, kind, t = plan[key]
+                if value is None or value.__class__ is dict:
+                    continue
+                if kind == _SCALAR:
+                    if value.__class__ is not t:
+                        if value.__class__ is list:
+                            value = _load_entities(
+                                value, map, ids, fixups, intern)
+                        value = _coerce(t, value)
+                    if intern is not None:
+                        value = intern(value)
+                elif kind == _ANONYMOUS:
+                    value = t(_load_entities(value, map, ids, fixups, intern))
+                elif kind == _SINGLE or kind == _RAW:
+                    if value.__class__ is list:
+                        value = _load_entities(
+                            value, map, ids, fixups, intern)
+                        value = value[0] if value else None
+                    elif kind == _SINGLE:
+                        value = _coerce(t, value)
+                    elif intern is not None:
+                        value = intern(value)
+                elif kind == _REF:
+                    target = ids.get(value)
+                    if target is None:
+                        if fixups is None:
+                            raise KeyError(value)
+                        if unresolved is None:
+                            unresolved = []
+                        unresolved.append((name, value))
+                        continue
+                    value = target
+                elif kind == _ID:
+                    entity_id = value
+                    continue
+                elif kind == _NAMED:
+                    value = t([(e.name, e) for e in _load_entities(
+                        value, map, ids, fixups, intern)])
                 else:
-                    attrs[a_name] = a_value
-        entity = entity_type(**attrs)
+                    continue
+                kw[name] = value
+        entity = entity_type._build(kw)
+        if unresolved is not None:
+            fixups.extend((entity, name, i) for name, i in unresolved)
         if entity_id is not None:
             ids[entity_id] = entity
         entities.append(entity)
     return entities
 
-def load(file_name, map):
-    ids = {}
-    text = open(file_name).read()
-    tree = yaml.load(text)
-    return _load_entities(tree, map, ids)
+def _fix_references(fixups, ids):
+    for entity, name, i in fixups:
+        entity._setters[name](entity, ids[i])
+
+def yaml_loader(accelerated=True):
+    if accelerated and _C_Safe_Loader is not None:
+        return _C_Safe_Loader
+    return yaml.SafeLoader
+
+def file_format(file_name):
+    # file_name may also be an open file object.  Text streams hold
+    # YAML, and binary streams are recognized by their header.
+    from . import binary
+    if hasattr(file_name, "read"):
+        if isinstance(file_name, io.TextIOBase):
+            return "yaml"
+    elif os.path.isdir(file_name):
+        return "directory"
+    return "binary" if binary.is_binary(file_name) else "yaml"
+
+def _parse(f, loader, stats):
+    # Files saved by earlier versions are upgraded as they are parsed
+    from . import migrations
+    version = migrations.file_version(f)
+    if version == migrations.current_version:
+        return yaml.load(f, Loader=loader)
+    if stats is not None:
+        stats["upgraded_from"] = version
+    return migrations.load_tree(f, version, loader is _C_Safe_Loader)
+
+def load(file_name, map, accelerated=True, stats=None, lazy=False,
+         intern=True, ids=None):
+    # file_name may also be an open file object.  If a stats dict is
+    # given, it is filled in with the backend and timing.  Binary files
+    # can be loaded lazily, see binary.load().  Equal strings and floats
+    # in YAML files are shared unless intern is False.  The ids of
+    # referenced entities are defined in the Id_Table ids if given.
+    format = file_format(file_name)
+    if format == "binary":
+        from . import binary
+        return binary.load(file_name, map, stats=stats, lazy=lazy, ids=ids)
+    elif format == "directory":
+        from . import directory
+        return directory.load(
+            file_name, map, stats=stats, intern=intern, ids=ids)
+    start = time.perf_counter()
+    loader = yaml_loader(accelerated)
+    if hasattr(file_name, "read"):
+        tree = _parse(file_name, loader, stats)
+    else:
+        with open(file_name) as f:
+            tree = _parse(f, loader, stats)
+    parsed = time.perf_counter()
+    found = {}
+    fixups = []
+    table = Intern_Table() if intern else None
+    entities = _load_entities(tree or [], map, found, fixups, table)
+    _fix_references(fixups, found)
+    if ids is not None:
+        for number, entity in found.items():
+            ids.define(entity, number)
+    if stats is not None:
+        stats["backend"] = "libyaml" if loader is _C_Safe_Loader else "python"
+        stats["parse_time"] = parsed - start
+        stats["build_time"] = time.perf_counter() - parsed
+        if table is not None:
+            stats["interned"] = table.hits
+            stats["intern_saved_bytes"] = table.saved_bytes
+    return entities
@@ -0,0 +1,456 @@
+# Copyright (c) 2020 Jeffrey A. Webb
+
+# Compact binary encoding of the same entity and reference model that
+# is written by wumps.dump().
+#
+# File layout:
+#   magic, major version (u8), minor version (u8)
+#   string table: count, then (byte length, UTF-8 bytes) per string
+#   type table: count, then (name, attribute count, attribute names)
+#               per type, all given as string table indices
+#   index: count, then per top-level item: type table index + 1 (0 if
+#          it is not an entity), name string index + 1 (0 if none),
+#          body offset, byte length, dependency count and the indices
+#          of the other items that define entities it references
+#   body: the top-level item values, back to back
+#
+# Version 1.0 files have no index and store the body as a count
+# followed by (byte length, value) per top-level item.
+#
+# All counts, lengths and indices are unsigned LEB128 varints.  Each
+# value starts with a one byte tag.  An entity is written as its type
+# table index and reference id (0 if it is not referenced) followed by
+# one value per attribute listed for its type.
+
+from . import base
+from .base import (
+    Entity, Lazy_Entity, Reference_Index, _resolve_all, replacing)
+
+from collections import OrderedDict
+import mmap
+import struct
+import time
+
+magic = b"\x89WUMPS\r\n"
+major_version = 1
+minor_version = 1
+
+_NONE = 0
+_FALSE = 1
+_TRUE = 2
+_INT = 3
+_FLOAT = 4
+_STR = 5
+_ENTITY = 6
+_REF = 7
+_LIST = 8
+_NAMED = 9
+
+_double = struct.Struct("<d")
+
+def is_binary(file_name):
+    # file_name may also be a stream opened in binary mode, which is
+    # left where it was.  Streams that can not be peeked at or sought
+    # are taken not to be binary.
+    if hasattr(file_name, "peek"):
+        return file_name.peek(len(magic))[:len(magic)] == magic
+    if hasattr(file_name, "read"):
+        if not file_name.seekable():
+            return False
+        position = file_name.tell()
+        head = file_name.read(len(magic))
+        file_name.seek(position)
+        return head == magic
+    with open(file_name, "rb") as f:
+        return f.read(len(magic)) == magic
+
+def _put_varint(out, n):
+    while n >= 0x80:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+
+class _Encoder:
+    def __init__(self, references, progress=None):
+        self.references = references
+        self.progress = progress
+        self.count = 0
+        self.strings = {}
+        self.types = {}
+        self.record = 0
+        self.defined = {}
+        self.used = set()
+
+    def string(self, s):
+        index = self.strings.get(s)
+        if index is None:
+            index = self.strings[s] = len(self.strings)
+        return index
+
+    def type_plan(self, entity_type):
+        plan = self.types.get(entity_type)
+        if plan is None:
+            attrs = tuple(
+                (a.name, a.reference is True)
+                for a in entity_type._attr_info_list if a.save is not False)
+            self.string(entity_type.__name__)
+            for name, reference in attrs:
+                self.string(name)
+            plan = self.types[entity_type] = (len(self.types), attrs)
+        return plan
+
+    def value(self, out, value):
+        t = value.__class__
+        if value is None:
+            out.append(_NONE)
+        elif t is str:
+            out.append(_STR)
+            _put_varint(out, self.string(value))
+        elif t is float:
+            out.append(_FLOAT)
+            out += _double.pack(value)
+        elif t is bool:
+            out.append(_TRUE if value else _FALSE)
+        elif t is int:
+            out.append(_INT)
+            _put_varint(out, value << 1 if value >= 0 else (-value << 1) - 1)
+        elif isinstance(value, Entity):
+            self.count += 1
+            if self.progress is not None and not self.count & 4095:
+                self.progress(self.count, self.references.entity_count)
+            index, attrs = self.type_plan(t)
+            out.append(_ENTITY)
+            _put_varint(out, index)
+            references = self.references
+            if value in references:
+                ref = references.id(value)
+                self.defined[ref] = self.record
+                _put_varint(out, ref)
+            else:
+                out.append(0)
+            for name, reference in attrs:
+                v = getattr(value, name)
+                if reference and v is not None:
+                    ref = references.id(v)
+                    self.used.add(ref)
+                    out.append(_REF)
+                    _put_varint(out, ref)
+                else:
+                    self.value(out, v)
+        elif isinstance(value, list):
+            out.append(_LIST)
+            _put_varint(out, len(value))
+            for v in value:
+                self.value(out, v)
+        elif isinstance(value, OrderedDict):
+            out.append(_NAMED)
+            _put_varint(out, len(value))
+            for v in value.values():
+                self.value(out, v)
+        elif isinstance(value, int):
+            self.value(out, int(value))
+        elif isinstance(value, float):
+            self.value(out, float(value))
+        else:
+            self.value(out, str(value))
+
+def dump(item, file, progress=None, ids=None, references=None):
+    # file must be opened in binary mode
+    item = _resolve_all(item)
+    if not isinstance(item, list):
+        item = [item]
+    if references is None:
+        references = Reference_Index(item, ids)
+    encoder = _Encoder(references, progress)
+    records = []
+    used = []
+    for i, top in enumerate(item):
+        encoder.record = i
+        encoder.used = set()
+        record = bytearray()
+        encoder.value(record, top)
+        records.append(record)
+        used.append(encoder.used)
+        if isinstance(top, Entity) and isinstance(top.name, str):
+            encoder.string(top.name)
+    out = bytearray(magic)
+    out.append(major_version)
+    out.append(minor_version)
+    _put_varint(out, len(encoder.strings))
+    for s in encoder.strings:
+        data = s.encode()
+        _put_varint(out, len(data))
+        out += data
+    _put_varint(out, len(encoder.types))
+    for entity_type, (index, attrs) in encoder.types.items():
+        _put_varint(out, encoder.strings[entity_type.__name__])
+        _put_varint(out, len(attrs))
+        for name, reference in attrs:
+            _put_varint(out, encoder.strings[name])
+    _put_varint(out, len(records))
+    offset = 0
+    for i, (top, record) in enumerate(zip(item, records)):
+        if isinstance(top, Entity):
+            _put_varint(out, encoder.types[type(top)][0] + 1)
+            name = top.name
+            _put_varint(out, encoder.strings[name] + 1 if
+                        isinstance(name, str) else 0)
+        else:
+            out += b"\0\0"
+        _put_varint(out, offset)
+        _put_varint(out, len(record))
+        offset += len(record)
+        deps = sorted({encoder.defined[ref] for ref in used[i]
+                       if encoder.defined.get(ref, i) != i})
+        _put_varint(out, len(deps))
+        for dep in deps:
+            _put_varint(out, dep)
+    file.write(out)
+    for record in records:
+        file.write(record)
+    if progress is not None:
+        progress(references.entity_count, references.entity_count)
+
+def save(item, file_name, progress=None, ids=None, references=None):
+    with replacing(file_name, "wb") as f:
+        dump(item, f, progress=progress, ids=ids, references=references)
+
+def _get_varint(buf, pos):
+    b = buf[pos]
+    if b < 0x80:
+        return b, pos + 1
+    n = b & 0x7f
+    shift = 7
+    while True:
+        pos += 1
+        b = buf[pos]
+        n |= (b & 0x7f) << shift
+        if b < 0x80:
+            return n, pos + 1
+        shift += 7
+
+class _Decoder:
+    def __init__(self, buf, map, table=None):
+        self.buf = buf
+        self.map = map
+        self.ids = {}
+        self.table = table # Id_Table of the decoded ids
+        self.fixups = []
+        pos = len(magic)
+        if buf[:pos] != magic:
+            raise ValueError("not a wumps binary file")
+        major, minor = buf[pos], buf[pos + 1]
+        if major != major_version:
+            raise ValueError(
+                f"unsupported wumps binary format version {major}.{minor}")
+        pos += 2
+        count, pos = _get_varint(buf, pos)
+        strings = []
+        for i in range(count):
+            n, pos = _get_varint(buf, pos)
+            strings.append(str(buf[pos:pos + n], "utf-8"))
+            pos += n
+        self.strings = strings
+        count, pos = _get_varint(buf, pos)
+        types = []
+        for i in range(count):
+            name, pos = _get_varint(buf, pos)
+            n, pos = _get_varint(buf, pos)
+            attrs = []
+            for j in range(n):
+                attr_name, pos = _get_varint(buf, pos)
+                attrs.append(strings[attr_name])
+            entity_type = map[strings[name]]
+            plan = []
+            for a in attrs:
+                a = entity_type._attr_info[a]
+                container = a.type if a.type is not None and issubclass(
+                    a.type, (list, OrderedDict)) else None
+                plan.append((a.name, a.reference is True, container))
+            types.append((entity_type, tuple(plan)))
+        self.types = types
+        # List of (entity type, name, offset, length, dependencies)
+        self.index = []
+        count, pos = _get_varint(buf, pos)
+        if minor == 0:
+            for i in range(count):
+                n, pos = _get_varint(buf, pos)
+                self.index.append((None, None, pos, n, None))
+                pos += n
+            return
+        entries = []
+        for i in range(count):
+            t, pos = _get_varint(buf, pos)
+            name, pos = _get_varint(buf, pos)
+            offset, pos = _get_varint(buf, pos)
+            n, pos = _get_varint(buf, pos)
+            n_deps, pos = _get_varint(buf, pos)
+            deps = []
+            for j in range(n_deps):
+                dep, pos = _get_varint(buf, pos)
+                deps.append(dep)
+            entries.append((types[t - 1][0] if t else None,
+                            strings[name - 1] if name else None,
+                            offset, n, deps))
+        self.index = [(t, name, pos + offset, n, deps)
+                      for t, name, offset, n, deps in entries]
+
+    def value(self, pos):
+        buf = self.buf
+        tag = buf[pos]
+        pos += 1
+        if tag == _STR:
+            n, pos = _get_varint(buf, pos)
+            return self.strings[n], pos
+        elif tag == _FLOAT:
+            return _double.unpack_from(buf, pos)[0], pos + 8
+        elif tag == _INT:
+            n, pos = _get_varint(buf, pos)
+            return (n >> 1) ^ -(n & 1), pos
+        elif tag == _NONE:
+            return None, pos
+        elif tag == _ENTITY:
+            n, pos = _get_varint(buf, pos)
+            entity_type, attrs = self.types[n]
+            entity_id, pos = _get_varint(buf, pos)
+            kw = {}
+            unresolved = None
+            for name, reference, container in attrs:
+                if reference and buf[pos] == _REF:
+                    ref, pos = _get_varint(buf, pos + 1)
+                    target = self.ids.get(ref)
+                    if target is None:
+                        if unresolved is None:
+                            unresolved = []
+                        unresolved.append((name, ref))
+                    else:
+                        kw[name] = target
+                    continue
+                v, pos = self.value(pos)
+                if v is not None:
+                    kw[name] = container(v) if container is not None else v
+            entity = entity_type._build(kw)
+            if entity_id:
+                self.ids[entity_id] = entity
+                if self.table is not None:
+                    self.table.define(entity, entity_id)
+            if unresolved is not None:
+                for name, ref in unresolved:
+                    self.fixups.append((entity, name, ref))
+            return entity, pos
+        elif tag == _LIST:
+            n, pos = _get_varint(buf, pos)
+            items = []
+            for i in range(n):
+                v, pos = self.value(pos)
+                items.append(v)
+            return items, pos
+        elif tag == _NAMED:
+            n, pos = _get_varint(buf, pos)
+            items = []
+            for i in range(n):
+                v, pos = self.value(pos)
+                items.append((v.name, v))
+            return items, pos
+        elif tag == _TRUE:
+            return True, pos
+        elif tag == _FALSE:
+            return False, pos
+        raise ValueError(f"bad value tag {tag} at offset {pos - 1}")
+
+    def resolve(self):
+        # References into records that have not been loaded yet stay
+        # pending.
+        pending = []
+        for entity, name, ref in self.fixups:
+            target = self.ids.get(ref)
+            if target is None:
+                pending.append((entity, name, ref))
+            else:
+                # Not a change, so trackers are not told
+                entity._setters[name](entity, target)
+        self.fixups = pending
+
+class _Lazy_Loader:
+    def __init__(self, file_name, map, ids=None):
+        self._file = open(file_name, "rb")
+        self._mmap = mmap.mmap(
+            self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._decoder = _Decoder(self._mmap, map, ids)
+        self._items = [None]*len(self._decoder.index)
+        self._loading = set()
+        self._remaining = len(self._items)
+
+    def items(self):
+        items = []
+        for i, (t, name, offset, n, deps) in enumerate(self._decoder.index):
+            if t is None or deps is None:
+                # Not an entity, or no dependency information
+                self.load(i)
+                items.append(self._items[i])
+            else:
+                items.append(Lazy_Entity(self, i, t, name))
+                self._items[i] = items[-1]
+        return items
+
+    def load(self, record):
+        item = self._items[record]
+        if record in self._loading:
+            return # Records referring to each other
+        if isinstance(item, Lazy_Entity):
+            if item._entity is not None:
+                return
+        elif item is not None:
+            return
+        t, name, offset, n, deps = self._decoder.index[record]
+        self._loading.add(record)
+        for dep in (deps if deps is not None else range(len(self._items))):
+            self.load(dep)
+        value, end = self._decoder.value(offset)
+        self._decoder.resolve()
+        self._loading.discard(record)
+        if isinstance(item, Lazy_Entity):
+            object.__setattr__(item, "_entity", value)
+        else:
+            self._items[record] = value
+        self._remaining -= 1
+        if self._remaining == 0:
+            self.close()
+        if isinstance(item, Lazy_Entity):
+            base._resolved(item)
+
+    def close(self):
+        if self._mmap is not None:
+            self._decoder.buf = None
+            self._mmap.close()
+            self._file.close()
+            self._mmap = None
+
+def load(file_name, map, stats=None, lazy=False, ids=None):
+    # With lazy=True, top-level entities are returned as Lazy_Entity
+    # proxies that are decoded from a memory map on first access.  The
+    # ids of referenced entities are defined in the Id_Table ids as
+    # they are decoded.
+    start = time.perf_counter()
+    if lazy and not hasattr(file_name, "read"):
+        loader = _Lazy_Loader(file_name, map, ids)
+        read = time.perf_counter()
+        entities = loader.items()
+    else:
+        if hasattr(file_name, "read"):
+            buf = file_name.read()
+        else:
+            with open(file_name, "rb") as f:
+                buf = f.read()
+        read = time.perf_counter()
+        decoder = _Decoder(buf, map, ids)
+        entities = []
+        for t, name, offset, n, deps in decoder.index:
+            entity, end = decoder.value(offset)
+            entities.append(entity)
+        decoder.resolve()
+    if stats is not None:
+        stats["backend"] = "binary"
+        stats["parse_time"] = read - start
+        stats["build_time"] = time.perf_counter() - read
+    return entities
@@ -0,0 +1,97 @@
+# Copyright (c) 2020 Jeffrey A. Webb
+
+# Change notification.  A Change_Bus collects the attribute changes
+# made through Entity.__setattr__ and __setitem__ and the mutations of
+# owned element containers, and delivers them to its subscribers in
+# batches of {entity: set of attribute names}.  The first change of a
+# batch calls schedule(flush), so a GUI can deliver each batch once per
+# event loop iteration; without a scheduler, batches are delivered by
+# calling flush().
+
+from collections import OrderedDict
+
+from . import base
+from .base import Entity, _walk
+
+def _own(items):
+    # Marks the element containers of all entities reachable from
+    # items as owned, so that their mutations are reported
+    seen = set()
+    def visit(entity):
+        if entity in seen:
+            return False
+        seen.add(entity)
+    _walk(items, visit, own=True)
+
+class Change_Bus:
+    def __init__(self, schedule=None):
+        self.schedule = schedule
+        self._subscriptions = []
+        self._pending = {}
+
+    def subscribe(self, callback, entities=None, attrs=None):
+        # callback(changes) is called with the changes to entities in
+        # the given collection, which is searched when the batch is
+        # delivered, and to the named attributes.  None selects all.
+        # Returns the subscription for unsubscribe().
+        subscription = (
+            callback, entities, None if attrs is None else frozenset(attrs))
+        self._subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        if subscription in self._subscriptions:
+            self._subscriptions.remove(subscription)
+
+    def attach(self, entities=()):
+        # Starts collecting changes, including those to the element
+        # containers of entities
+        _own(entities)
+        if self not in base._trackers:
+            base._trackers.append(self)
+
+    def close(self):
+        if self in base._trackers:
+            base._trackers.remove(self)
+        self._pending = {}
+
+    def _changed(self, entity, key):
+        names = self._pending.get(entity)
+        if names is None:
+            if not self._pending and self.schedule is not None:
+                self.schedule(self.flush)
+            names = self._pending[entity] = set()
+        names.add(entity._attr_info[key].name)
+
+    def discard(self):
+        # Drops the changes that have not been delivered yet
+        self._pending = {}
+
+    def flush(self):
+        # Delivers the changes collected since the last flush
+        changes = self._pending
+        if not changes:
+            return
+        self._pending = {}
+        # Entities added to the model get their containers owned
+        for entity, names in changes.items():
+            for name in names.intersection(entity._nested_attrs):
+                value = getattr(entity, name)
+                if isinstance(value, (Entity, list, OrderedDict)):
+                    _own(value.values() if isinstance(value, OrderedDict)
+                         else [value])
+        for callback, entities, attrs in list(self._subscriptions):
+            if entities is None and attrs is None:
+                selected = changes
+            else:
+                selected = {}
+                for entity, names in changes.items():
+                    if entities is not None and entity not in entities:
+                        continue
+                    if attrs is not None:
+                        names = names & attrs
+                        if not names:
+                            continue
+                    selected[entity] = names
+            if selected:
+                callback(selected)
@@ -0,0 +1,308 @@
+# Copyright (c) 2020 Jeffrey A. Webb
+
+# Projects stored as a directory of wumps YAML files:
+#
+#   index.yaml   the file of each top-level entity, in order
+#   shared.hp    top-level entities of the shared types, by default
+#                those with a true _shared class attribute
+#   0001.hp ...  one file for each other top-level entity
+#
+# Ids of referenced entities are unique within the directory and are
+# kept from one save to the next, so references can cross files and
+# files that did not change are not rewritten.  Files are parsed in a
+# process pool when the project is large; changed files are written by
+# forked processes, where available, which see the entities without
+# pickling them.  Processes that must not fork, such as the GUI, spawn
+# the processes that parse files and write files from threads.
+
+import os
+import time
+
+import yaml
+
+from . import base
+from .base import (
+    Id_Table, Intern_Table, Reference_Index, _C_Safe_Loader, _fix_references,
+    _load_entities, _walk, dump, replacing, resolve, snapshot, yaml_loader)
+
+index_name = "index.yaml"
+shared_name = "shared.hp"
+
+_header = '# {format: "wumps-directory", major_version: 0, minor_version: 1}'
+_parallel_load_size = 1<<20 # bytes
+_parallel_save_count = 20000 # entities
+
+def _parse(file_name):
+    # Runs in a worker process
+    with open(file_name) as f:
+        return yaml.load(f, Loader=yaml_loader()) or []
+
+def _pool(workers, start_method=None, threads=False):
+    # The pool modules are imported on first use, as they are slow to
+    # import and only needed for large projects
+    import concurrent.futures
+    if threads:
+        return concurrent.futures.ThreadPoolExecutor(workers)
+    import multiprocessing
+    context = multiprocessing.get_context(start_method)
+    return concurrent.futures.ProcessPoolExecutor(workers, mp_context=context)
+
+def _can_fork():
+    import multiprocessing
+    return "fork" in multiprocessing.get_all_start_methods()
+
+_jobs = None
+
+def _write(job):
+    file_name, items, references = _jobs[job]
+    with replacing(file_name) as f:
+        dump(items, file=f, references=references)
+
+def _write_all(jobs, workers, fork=True, progress=None):
+    # Forked processes see the entities without pickling them.  Where
+    # forking is not safe, threads overlap the writes instead.
+    global _jobs
+    _jobs = jobs
+    try:
+        if workers > 1:
+            with _pool(workers, "fork", threads=not fork) as pool:
+                list(pool.map(_write, range(len(jobs))))
+                if progress is not None:
+                    progress(len(jobs), len(jobs))
+        else:
+            for job in range(len(jobs)):
+                _write(job)
+                if progress is not None:
+                    progress(job + 1, len(jobs))
+    finally:
+        _jobs = None
+
+class Project_Directory:
+    def __init__(self, directory, map=None, shared_types=None, workers=None,
+                 ids=None, fork=True):
+        self.directory = directory
+        self.shared_types = (
+            None if shared_types is None else tuple(shared_types))
+        self.workers = workers # None for one per CPU
+        # Whether worker processes may be forked, which is not safe in
+        # processes running Qt.  Otherwise they are spawned for loading
+        # and threads are used for saving.
+        self.fork = fork
+        self.ids = Id_Table() if ids is None else ids
+        self._map = map
+        self._references = Reference_Index(ids=self.ids)
+        self._top = []
+        self._files = {}     # top-level entity -> file name
+        self._locations = {} # entity -> file name
+        self._sizes = {}     # file name -> number of entities
+        self._dirty = set()
+        self._next_file = 1
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _is_shared(self, entity):
+        if self.shared_types is None:
+            return entity._shared
+        return isinstance(entity, self.shared_types)
+
+    def _changed(self, entity, key):
+        a = entity._attr_info[key]
+        if a.save is False and a.reference is not True:
+            return
+        name = self._locations.get(entity)
+        if name is not None:
+            self._dirty.add(name)
+
+    def _place(self, name, items):
+        # Records the file of every entity in items and marks their
+        # element containers as owned
+        locations = self._locations
+        count = 0
+        def visit(entity):
+            nonlocal count
+            count += 1
+            locations[entity] = name
+        _walk(items, visit, own=True)
+        self._sizes[name] = count
+
+    def _index_names(self):
+        try:
+            with open(self._path(index_name)) as f:
+                index = yaml.load(f, Loader=yaml_loader()) or {}
+        except FileNotFoundError:
+            return []
+        return index.get("entities") or []
+
+    def load(self, stats=None, intern=True):
+        start = time.perf_counter()
+        order = self._index_names()
+        names = list(dict.fromkeys(order))
+        paths = [self._path(name) for name in names]
+        workers = 1
+        if (len(paths) > 1 and
+            sum(os.path.getsize(p) for p in paths) >= _parallel_load_size):
+            workers = min(len(paths), self.workers or os.cpu_count() or 1)
+        if workers > 1:
+            with _pool(workers, None if self.fork else "spawn") as pool:
+                trees = list(pool.map(_parse, paths))
+        else:
+            trees = [_parse(path) for path in paths]
+        parsed = time.perf_counter()
+        ids = {}
+        fixups = []
+        table = Intern_Table() if intern else None
+        loaded = {}
+        for name, tree in zip(names, trees):
+            loaded[name] = iter(
+                _load_entities(tree, self._map, ids, fixups, table))
+        _fix_references(fixups, ids)
+        entities = [next(loaded[name]) for name in order]
+        self.attach(entities, order, ids)
+        if stats is not None:
+            stats["backend"] = (
+                "libyaml" if yaml_loader() is _C_Safe_Loader else "python")
+            stats["parse_time"] = parsed - start
+            stats["build_time"] = time.perf_counter() - parsed
+            stats["files"] = len(names)
+            stats["workers"] = workers
+            if table is not None:
+                stats["interned"] = table.hits
+                stats["intern_saved_bytes"] = table.saved_bytes
+        return entities
+
+    def attach(self, entities, order, ids):
+        # Starts tracking changes to entities, stored in the files named
+        # in order and referenced by the given ids
+        self._references = Reference_Index(ids=self.ids)
+        for number, entity in ids.items():
+            self._references.define(entity, number)
+        self._top = list(entities)
+        self._files = dict(zip(entities, order))
+        self._locations = {}
+        self._sizes = {}
+        for name in set(order):
+            self._place(name, [e for e in entities if self._files[e] == name])
+        self._dirty = set()
+        for name in order:
+            if name != shared_name:
+                self._next_file = max(
+                    self._next_file, int(name.split(".")[0]) + 1)
+        if self not in base._trackers:
+            base._trackers.append(self)
+
+    def close(self):
+        if self in base._trackers:
+            base._trackers.remove(self)
+
+    def _new_name(self, used):
+        while True:
+            name = f"{self._next_file:04d}.hp"
+            self._next_file += 1
+            if name not in used and not os.path.exists(self._path(name)):
+                return name
+
+    def save(self, entities):
+        # Writes the files that changed since the last load or save and
+        # returns their names
+        return self.prepare_save(entities, copy=False)()
+
+    def prepare_save(self, entities, copy=True):
+        # Works out the files that changed and returns a function
+        # write(progress=None) that writes them and returns their names.
+        # With copy=True, write() works on a snapshot of them, so it
+        # can run in another thread while the entities are changed.
+        entities = [resolve(e) for e in entities]
+        os.makedirs(self.directory, exist_ok=True)
+        old_names = set(self._index_names()) | set(self._files.values())
+        dirty = self._dirty
+        files = {}
+        for entity in entities:
+            name = self._files.get(entity)
+            if name is None:
+                if self._is_shared(entity):
+                    name = shared_name
+                else:
+                    name = self._new_name(old_names | set(files.values()))
+                dirty.add(name)
+            files[entity] = name
+        order = [files[e] for e in entities]
+        shared = [e for e in entities if files[e] == shared_name]
+        if shared != [e for e in self._top if
+                      self._files.get(e) == shared_name]:
+            dirty.add(shared_name)
+        dirty &= set(order)
+        contents = {name: [] for name in order}
+        for entity in entities:
+            contents[files[entity]].append(entity)
+        # Entities no longer in the project are forgotten, so that they
+        # are not kept alive
+        kept = set(order) - dirty
+        self._locations = {entity: name for entity, name
+                           in self._locations.items() if name in kept}
+        for name in dirty:
+            self._place(name, contents[name])
+        references = self._references
+        references.prune(self._locations)
+
+        # Entities referenced for the first time get ids, which are
+        # written to the files that hold them
+        pending = list(dirty)
+        while pending:
+            added = []
+            references.add(contents[pending.pop()], added)
+            for entity in added:
+                references.id(entity)
+                name = self._locations.get(entity)
+                if name in contents and name not in dirty:
+                    dirty.add(name)
+                    pending.append(name)
+
+        written = sorted(dirty)
+        items = [contents[name] for name in written]
+        if copy:
+            # The copies of referenced entities have the same ids
+            copy_ids = Id_Table()
+            items = snapshot(items, references.ids, copy_ids)
+            references = Reference_Index(ids=copy_ids)
+            for number, entity in list(copy_ids.items()):
+                references.define(entity, number)
+        jobs = [(self._path(name), contents, references)
+                for name, contents in zip(written, items)]
+        workers = 1
+        if (len(jobs) > 1 and
+            sum(self._sizes[name] for name in dirty) >= _parallel_save_count
+            and (_can_fork() or not self.fork)):
+            workers = min(len(jobs), self.workers or os.cpu_count() or 1)
+        index_changed = order != self._index_names()
+        removed = old_names - set(order)
+        self._top = entities
+        self._files = files
+        self._dirty = set()
+        if self not in base._trackers:
+            base._trackers.append(self)
+
+        def write(progress=None):
+            _write_all(jobs, workers, fork=self.fork, progress=progress)
+            if index_changed:
+                with replacing(self._path(index_name)) as f:
+                    f.write(_header + "\nentities:\n")
+                    f.write("".join(f"- {name}\n" for name in order))
+            for name in removed:
+                if os.path.exists(self._path(name)):
+                    os.remove(self._path(name))
+            return written
+        return write
+
+def load(directory, map, stats=None, intern=True, ids=None,
+         shared_types=None):
+    project = Project_Directory(
+        directory, map, shared_types=shared_types, ids=ids)
+    entities = project.load(stats=stats, intern=intern)
+    project.close()
+    return entities
+
+def save(item, directory, ids=None, shared_types=None):
+    project = Project_Directory(directory, shared_types=shared_types, ids=ids)
+    project.save(item if isinstance(item, list) else [item])
+    project.close()
@@ -0,0 +1,424 @@
+# Copyright (c) 2020 Jeffrey A. Webb
+
+# Incremental saving.  Changes made after a project file has been
+# loaded or saved are appended to "<file>.journal", one JSON record per
+# line:
+#
+#   {"journal": 1, "base": [size, mtime_ns]}    header
+#   {"new": key, "type": name, "attrs": {...}}  entity created
+#   {"set": key, "attrs": {...}}                attributes changed
+#   {"top": [{"k": key}, ...]}                  top-level entities changed
+#   {"commit": n}                               end of save n
+#
+# Entities are addressed by their ids in the project file, which are
+# written for every entity when the journal rewrites the project file,
+# so the same keys are found again however the entities are reached.
+# A project file without them is rewritten by the first save, and
+# until then unsaved changes are not recorded.  Entity values are
+# written as {"k": key}, element
+# containers as {"a": [...]} (anonymous) or {"n": [...]} (named).
+# Records after the last commit are ignored when the journal is
+# replayed, and a journal whose header does not match the project file
+# is stale and ignored.  When the journal grows large compared to the
+# project file, the next save rewrites the project file instead.
+#
+# Unsaved changes are appended to "<file>.recovery" in the same format
+# by autosave().  Its header also records the size of the journal, and
+# it is removed by the next save.
+
+import json
+import os
+import weakref
+
+from . import base
+from .base import (
+    Anonymous_Elements_Base, Entity, Id_Table, Lazy_Entity,
+    Named_Elements_Base, Reference_Index, _walk, resolve)
+
+_version = 2
+
+def _file_stamp(file_name):
+    st = os.stat(file_name)
+    return [st.st_size, st.st_mtime_ns]
+
+def _read(file_name, header):
+    # Returns the committed batches of records, or None if the header
+    # does not match
+    with open(file_name) as f:
+        lines = f.readlines()
+    try:
+        found = json.loads(lines[0])
+    except (IndexError, ValueError):
+        found = None
+    if found != header:
+        print(f"ignoring stale journal: {file_name}")
+        return None
+    batches = []
+    batch = []
+    for line in lines[1:]:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            break # Partially written save
+        if "commit" in record:
+            batches.append(batch)
+            batch = []
+        else:
+            batch.append(record)
+    return batches
+
+def _append(file_name, header, records, commit):
+    # Starts a new file if header is given
+    with open(file_name, "a" if header is None else "w") as f:
+        if header is not None:
+            f.write(json.dumps(header) + "\n")
+        f.write("".join(json.dumps(r, separators=(",", ":")) + "\n"
+                        for r in records))
+        f.write(json.dumps({"commit": commit}) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+def _remove(file_name):
+    if os.path.exists(file_name):
+        os.remove(file_name)
+
+class Journal:
+    def __init__(self, file_name, map, format="yaml",
+                 compact_size=1<<16, compact_ratio=0.5, ids=None):
+        self.file_name = file_name
+        self.journal_name = file_name + ".journal"
+        self.recovery_name = file_name + ".recovery"
+        self.format = format
+        self.compact_size = compact_size
+        self.compact_ratio = compact_ratio
+        # Id_Table kept by saves of the whole project, which gives the
+        # keys of the entities
+        self.ids = Id_Table() if ids is None else ids
+        self._map = map
+        self._tracked = weakref.WeakSet() # Entities with keys
+        self._lazy = set() # Lazy_Entity items tracked once decoded
+        self._stable = False # Whether the project file has all the keys
+        self._top = []
+        self._dirty = {}
+        self._commits = 0
+        self._journal_ok = False
+        self._recovery_top = []
+        self._unrecorded = {}
+        self._unsaved_new = []
+        self._recovery_commits = 0
+        self._recovery_ok = False
+        self._write_ids = None
+
+    def _changed(self, entity, key):
+        # Entities that are not part of the project are written in full
+        # once they are
+        if entity not in self._tracked:
+            return
+        name = entity._attr_info[key].name
+        names = self._dirty.get(entity)
+        if names is None:
+            names = self._dirty[entity] = set()
+        names.add(name)
+        names = self._unrecorded.get(entity)
+        if names is None:
+            names = self._unrecorded[entity] = set()
+        names.add(name)
+
+    def _add(self, entity):
+        self._tracked.add(entity)
+        return self.ids.id(entity)
+
+    def _walk(self, items):
+        # Gives keys to all entities reachable from items that do not
+        # have one yet and marks their element containers as owned.
+        # Returns the number of entities that had no id.
+        missing = 0
+        def visit(entity):
+            nonlocal missing
+            if entity in self._tracked:
+                return False
+            if entity not in self.ids:
+                missing += 1
+            self._add(entity)
+        _walk(items, visit, own=True)
+        return missing
+
+    def attach(self, entities):
+        # Starts tracking changes to entities, which must be exactly
+        # what is stored in the project file.  Entities that are loaded
+        # lazily are tracked when they are decoded.
+        self._lazy = {e for e in entities
+                      if isinstance(e, Lazy_Entity) and not e.loaded()}
+        entities = [e if e in self._lazy else resolve(e) for e in entities]
+        self._tracked = weakref.WeakSet()
+        self._dirty = {}
+        self._unrecorded = {}
+        self._unsaved_new = []
+        self._recovery_ok = False
+        self._recovery_commits = 0
+        self._stable = self._walk(
+            [e for e in entities if e not in self._lazy]) == 0
+        self._top = list(entities)
+        self._recovery_top = list(entities)
+        if self not in base._trackers:
+            base._trackers.append(self)
+        if self not in base._resolvers:
+            base._resolvers.append(self)
+        return entities
+
+    def _resolved(self, item):
+        if item in self._lazy:
+            self._lazy.discard(item)
+            if self._walk([item._entity]):
+                self._stable = False # The file does not have their keys
+
+    def close(self):
+        if self in base._trackers:
+            base._trackers.remove(self)
+        if self in base._resolvers:
+            base._resolvers.remove(self)
+        self._dirty = {}
+        self._unrecorded = {}
+
+    def _header(self):
+        return {"journal": _version, "base": _file_stamp(self.file_name)}
+
+    def _recovery_header(self):
+        header = self._header()
+        header["journal_size"] = (
+            os.path.getsize(self.journal_name) if self._journal_ok else 0)
+        return header
+
+    def load(self, stats=None, recover=None, lazy=False):
+        # recover(journal) is asked whether to restore the changes in
+        # a recovery file; they are restored as unsaved changes.  With
+        # lazy=True, binary files are loaded lazily when there are no
+        # records to replay, which can refer to any entity.
+        entities = base.load(
+            self.file_name, self._map, stats=stats, ids=self.ids, lazy=lazy)
+        if (os.path.exists(self.journal_name) or
+            os.path.exists(self.recovery_name)):
+            entities = [resolve(e) for e in entities]
+        entities = self.attach(entities)
+        base._trackers.remove(self) # Replaying is not a change
+        # Entities are held until replaying is done, as later records
+        # can refer to ones that earlier records removed
+        keep = list(self._tracked)
+        try:
+            records = 0
+            if os.path.exists(self.journal_name):
+                batches = _read(self.journal_name, self._header())
+                if batches is not None:
+                    for batch in batches:
+                        self._apply(batch, keep=keep)
+                        records += len(batch)
+                    self._commits = len(batches)
+                    self._journal_ok = True
+                    self._recovery_top = self._top
+            recovered = 0
+            if os.path.exists(self.recovery_name):
+                batches = _read(self.recovery_name, self._recovery_header())
+                if batches and (recover is None or recover(self)):
+                    saved_top = self._top
+                    for batch in batches:
+                        self._apply(batch, unsaved=True, keep=keep)
+                        recovered += len(batch)
+                    self._recovery_top = self._top
+                    self._top = saved_top
+                    self._recovery_commits = len(batches)
+                    self._recovery_ok = True
+                elif batches:
+                    self.discard_recovery()
+        finally:
+            base._trackers.append(self)
+        if stats is not None:
+            stats["journal_records"] = records
+            stats["recovered_records"] = recovered
+        return list(self._recovery_top if recovered else self._top)
+
+    def _apply(self, records, unsaved=False, keep=None):
+        # Changes applied with unsaved=True are written by the next
+        # save.  New entities are appended to keep.
+        for record in records:
+            if "new" in record:
+                entity_type = self._map[record["type"]]
+                entity = entity_type._build({})
+                self.ids.define(entity, record["new"])
+                self._tracked.add(entity)
+                if keep is not None:
+                    keep.append(entity)
+                if unsaved:
+                    self._unsaved_new.append(entity)
+        for record in records:
+            if "top" in record:
+                self._top = self._decode(record["top"])
+                continue
+            key = record["new"] if "new" in record else record["set"]
+            entity = self.ids.get(key)
+            for name, value in record["attrs"].items():
+                t = entity._attr_info[name].type
+                value = self._decode(value, t)
+                if isinstance(value, (Anonymous_Elements_Base,
+                                      Named_Elements_Base)):
+                    value._owner = (entity, name)
+                entity._setters[name](entity, value)
+            if unsaved and "set" in record:
+                self._dirty.setdefault(entity, set()).update(record["attrs"])
+
+    def _decode(self, value, t=None):
+        if isinstance(value, dict):
+            if "k" in value:
+                return self.ids.get(value["k"])
+            if "a" in value:
+                items = [self._decode(v) for v in value["a"]]
+                return t(items) if t is not None else items
+            if "n" in value:
+                items = [self._decode(v) for v in value["n"]]
+                return t([(e.name, e) for e in items])
+        elif isinstance(value, list):
+            return [self._decode(v) for v in value]
+        return value
+
+    def _encode(self, value, new):
+        if isinstance(value, Entity):
+            if value not in self._tracked:
+                self._add(value)
+                new.append(value)
+            return {"k": self.ids.id(value)}
+        if isinstance(value, Named_Elements_Base):
+            return {"n": [self._encode(v, new) for v in value.values()]}
+        if isinstance(value, Anonymous_Elements_Base):
+            return {"a": [self._encode(v, new) for v in value]}
+        if isinstance(value, list):
+            return [self._encode(v, new) for v in value]
+        return value
+
+    def _encode_attrs(self, entity, names, new):
+        attrs = {}
+        for name in entity._nested_attrs + entity._reference_attrs:
+            if names is None or name in names:
+                value = getattr(entity, name)
+                if isinstance(value, (Anonymous_Elements_Base,
+                                      Named_Elements_Base)):
+                    value._owner = (entity, name)
+                attrs[name] = self._encode(value, new)
+        return attrs
+
+    def _records(self, dirty, top, entities, new):
+        # Records for the changes in dirty and for entities compared to
+        # top.  Entities in new, and entities that get their key here,
+        # are written in full and returned.
+        records = []
+        if entities != top:
+            records.append({"top": [self._encode(resolve(e), new)
+                                    for e in entities]})
+        for entity, names in dirty.items():
+            if entity not in self._tracked:
+                continue # Written in full once it is part of the project
+            attrs = self._encode_attrs(entity, names, new)
+            if attrs:
+                records.append({"set": self.ids.id(entity), "attrs": attrs})
+        written = []
+        while new:
+            entity = new.pop()
+            written.append(entity)
+            records.append({
+                "new": self.ids.id(entity),
+                "type": entity.__class__.__name__,
+                "attrs": self._encode_attrs(entity, None, new),
+            })
+        return records, written
+
+    def modified(self):
+        # Whether there are changes that have not been saved
+        return bool(self._dirty or self._unsaved_new or
+                    self._top != self._recovery_top)
+
+    def recording(self):
+        # Whether changes can be recorded, which needs the keys in the
+        # project file
+        return self._stable
+
+    def needs_compaction(self):
+        if not self._stable:
+            return True
+        return self._journal_ok and os.path.getsize(self.journal_name) > max(
+            self.compact_size,
+            self.compact_ratio*os.path.getsize(self.file_name))
+
+    def save(self, entities):
+        # Appends the changes made since the last save to the journal,
+        # or rewrites the project file when the journal is too large.
+        # Returns True if the project file was rewritten.
+        if self.needs_compaction():
+            self.compact(entities)
+            return True
+        entities = list(entities)
+        records, written = self._records(
+            self._dirty, self._top, entities, self._unsaved_new)
+        self._top = entities
+        self._recovery_top = entities
+        self._dirty = {}
+        self._unrecorded = {}
+        self._unsaved_new = []
+        if records:
+            self._commits += 1
+            _append(self.journal_name,
+                    None if self._journal_ok else self._header(),
+                    records, self._commits)
+            self._journal_ok = True
+        self.discard_recovery()
+        return False
+
+    def autosave(self, entities):
+        # Appends the changes made since the last save or autosave to
+        # the recovery file.  Returns True if anything was written.
+        if not self._stable:
+            return False # The keys would not be found again
+        entities = list(entities)
+        records, written = self._records(
+            self._unrecorded, self._recovery_top, entities, [])
+        self._recovery_top = entities
+        self._unrecorded = {}
+        self._unsaved_new.extend(written)
+        if not records:
+            return False
+        self._recovery_commits += 1
+        _append(self.recovery_name,
+                None if self._recovery_ok else self._recovery_header(),
+                records, self._recovery_commits)
+        self._recovery_ok = True
+        return True
+
+    def discard_recovery(self):
+        _remove(self.recovery_name)
+        self._recovery_ok = False
+        self._recovery_commits = 0
+
+    def snapshot(self, entities):
+        # First half of compact(): copies the project for write() and
+        # tracks later changes against the copy.  No other save or
+        # autosave may happen until write() is done.
+        entities = self.attach([resolve(e) for e in entities])
+        self._stable = True # Once written
+        self._journal_ok = False
+        self._commits = 0
+        self._write_ids = Id_Table()
+        return base.snapshot(entities, self.ids, self._write_ids)
+
+    def write(self, snapshot, progress=None):
+        # Second half of compact(), which does not touch the live
+        # entities and can run in another thread.  The ids of all
+        # entities are written, as they are the keys of the journal.
+        references = Reference_Index(snapshot, self._write_ids)
+        for number, entity in list(self._write_ids.items()):
+            references.define(entity, number)
+        base.save(snapshot, file_name=self.file_name, format=self.format,
+                  progress=progress, references=references)
+        self._write_ids = None
+        _remove(self.journal_name)
+        _remove(self.recovery_name)
+
+    def compact(self, entities):
+        # Writes the whole project and starts an empty journal
+        self.write(self.snapshot(entities))
@@ -0,0 +1,193 @@
+# Copyright (c) 2020 Jeffrey A. Webb
+
+# Upgrades of YAML files saved by earlier versions.  A migration
+# upgrades one version to the next as a transform of the YAML parse
+# events: it takes an iterator of events and yields the events of the
+# upgraded file.  Migrations are chained up to the current version and
+# all run in the same pass over the file, so a file is upgraded as it
+# is parsed, without building its tree first.  load() upgrades the
+# files it reads this way, and upgrade() rewrites a file with bounded
+# memory.  The version of a file is read from its header comment, and
+# files without one are version 0.0.
+
+import yaml
+
+from . import base
+from .base import replacing, yaml_loader
+
+try:
+    from yaml import CSafeDumper as _Dumper
+except ImportError: # PyYAML was built without libyaml
+    from yaml import SafeDumper as _Dumper
+
+def _header_version(line):
+    # (major, minor) from a header comment, or None
+    if not line.startswith("#"):
+        return None
+    try:
+        header = yaml.safe_load(line[1:])
+    except yaml.YAMLError:
+        return None
+    if not isinstance(header, dict) or "major_version" not in header:
+        return None
+    return (header["major_version"], header.get("minor_version", 0))
+
+current_version = _header_version(base._header)
+
+_migrations = {} # version -> [(next version, migration)]
+
+def migration(from_version, to_version):
+    # Decorator registering a migration.  Several migrations may
+    # upgrade the same version, such as those of different packages,
+    # as long as they lead to the same next version.
+    def register(function):
+        found = _migrations.setdefault(tuple(from_version), [])
+        if found and found[0][0] != tuple(to_version):
+            raise ValueError(
+                f"migrations from file version "
+                f"{_version_name(from_version)} lead to both "
+                f"{_version_name(found[0][0])} and "
+                f"{_version_name(to_version)}")
+        found.append((tuple(to_version), function))
+        return function
+    return register
+
+def _version_name(version):
+    return ".".join(str(v) for v in version)
+
+def migrations(version):
+    # The migrations leading from version to the current version
+    chain = []
+    while version != current_version:
+        found = _migrations.get(version)
+        if not found:
+            raise ValueError(
+                f"no upgrade from file version {_version_name(version)} "
+                f"to {_version_name(current_version)}")
+        for next_version, function in found:
+            chain.append(function)
+        version = next_version
+    return chain
+
+def migrate(events, version):
+    for function in migrations(version):
+        events = function(events)
+    return events
+
+def file_version(f):
+    # Version of an open YAML file, which is left where it was.  Binary
+    # streams that can not be sought, such as pipes, are peeked at.
+    if f.seekable():
+        position = f.tell()
+        line = f.readline()
+        f.seek(position)
+    elif hasattr(f, "peek"):
+        line = f.peek(len(base._header) + 1).split(b"\n")[0]
+    else:
+        raise ValueError(
+            "can not read the file version of a stream that can not be "
+            "sought, open it in binary mode")
+    if isinstance(line, bytes):
+        line = line.decode("utf-8", "replace")
+    version = _header_version(line)
+    return (0, 0) if version is None else version
+
+_KEY = object()
+
+_NODE = 0
+_MAPPING = 1
+_SEQUENCE = 2
+_END = 3
+
+_kinds = {
+    yaml.ScalarEvent: _NODE,
+    yaml.AliasEvent: _NODE,
+    yaml.MappingStartEvent: _MAPPING,
+    yaml.SequenceStartEvent: _SEQUENCE,
+    yaml.MappingEndEvent: _END,
+    yaml.SequenceEndEvent: _END,
+}
+
+def keyed(events):
+    # Yields (owner, key, event) for each event.  When the event is a
+    # scalar or starts a collection that is the value of a mapping key,
+    # key is that key and owner the key above the mapping, which in a
+    # wumps file is the entity type holding the attribute key.  They
+    # are None elsewhere.
+    stack = [] # [key above, key read or _KEY] per mapping, None per sequence
+    frame = None
+    kinds = _kinds
+    for event in events:
+        kind = kinds.get(event.__class__)
+        if kind is None:
+            yield None, None, event
+            continue
+        if kind == _END:
+            stack.pop()
+            frame = stack[-1] if stack else None
+            yield None, None, event
+            continue
+        owner = key = None
+        if frame is not None:
+            if frame[1] is _KEY:
+                frame[1] = getattr(event, "value", None)
+            else:
+                owner = frame[0]
+                key = frame[1]
+                frame[1] = _KEY
+        if kind == _MAPPING:
+            frame = [key, _KEY]
+            stack.append(frame)
+        elif kind == _SEQUENCE:
+            frame = None
+            stack.append(frame)
+        yield owner, key, event
+
+class _Event_Loader(yaml.composer.Composer, yaml.constructor.SafeConstructor,
+                    yaml.resolver.Resolver):
+    # Builds the tree from an iterator of events instead of a parser
+    def __init__(self, events):
+        self._events = iter(events)
+        self._event = None
+        yaml.composer.Composer.__init__(self)
+        yaml.constructor.SafeConstructor.__init__(self)
+        yaml.resolver.Resolver.__init__(self)
+
+    def check_event(self, *choices):
+        if self._event is None:
+            self._event = next(self._events, None)
+            if self._event is None:
+                return False
+        return not choices or isinstance(self._event, choices)
+
+    def peek_event(self):
+        self.check_event()
+        return self._event
+
+    def get_event(self):
+        event = self.peek_event()
+        self._event = None
+        return event
+
+    def dispose(self):
+        pass
+
+def load_tree(f, version, accelerated=True):
+    # The tree of an open YAML file of an earlier version, upgraded
+    events = yaml.parse(f, Loader=yaml_loader(accelerated))
+    return _Event_Loader(migrate(events, version)).get_single_data()
+
+def upgrade(file_name, output=None, accelerated=True):
+    # Rewrites a YAML file of an earlier version as the current
+    # version, to the file output or in place.  Returns the version
+    # the file had.
+    with open(file_name) as f:
+        version = file_version(f)
+        if version == current_version and output is None:
+            return version
+        events = migrate(yaml.parse(f, Loader=yaml_loader(accelerated)),
+                         version)
+        with replacing(output or file_name) as out:
+            out.write(base._header + "\n")
+            yaml.emit(events, out, Dumper=_Dumper)
+    return version
@@ -0,0 +1,114 @@
+# Copyright (c) 2020 Jeffrey A. Webb
+
+# Copy-on-write snapshots.  A Snapshots tracker keeps the copy of each
+# entity made by the last take(), and which copies lead to it.  The
+# next take() only copies the entities changed since then, and the
+# entities whose copies lead to them: their parents up to the top, and
+# the entities referring to them.  Everything else is shared with the
+# earlier snapshots.  Like those of wumps.snapshot(), the copies hold
+# the saved attributes only, and references lead to the copies of
+# their targets.  Copies must not be changed, so they can be saved,
+# exported or read in another thread while the originals are edited.
+
+import weakref
+
+from . import base
+from .base import (
+    Anonymous_Elements_Base, Named_Elements_Base, Reference_Index,
+    _copy_value, _resolve_all)
+
+def _add_dependent(dependents, entity, dependent):
+    # One weak reference until there is a second dependent
+    found = dependents.get(entity)
+    if found is None:
+        dependents[entity] = weakref.ref(dependent)
+    elif isinstance(found, weakref.ref):
+        if found() is not dependent:
+            dependents[entity] = weakref.WeakSet(
+                [d for d in (found(), dependent) if d is not None])
+    else:
+        found.add(dependent)
+
+class Snapshots:
+    def __init__(self):
+        self._copies = weakref.WeakKeyDictionary() # entity -> copy
+        self._dependents = weakref.WeakKeyDictionary()
+        self._dirty = set()
+
+    def close(self):
+        # Stops following changes and drops the copies
+        if self in base._trackers:
+            base._trackers.remove(self)
+        self._copies = weakref.WeakKeyDictionary()
+        self._dependents = weakref.WeakKeyDictionary()
+        self._dirty = set()
+
+    def _changed(self, entity, key):
+        a = entity._attr_info[key]
+        if a.save is False and a.reference is not True:
+            return
+        if entity in self._copies:
+            self._dirty.add(entity)
+
+    def _invalidate(self):
+        # Drops the copies that lead to changed entities
+        copies = self._copies
+        dependents = self._dependents
+        stale = set()
+        pending = list(self._dirty)
+        self._dirty = set()
+        while pending:
+            entity = pending.pop()
+            if entity in stale:
+                continue
+            stale.add(entity)
+            copies.pop(entity, None)
+            found = dependents.pop(entity, None)
+            if isinstance(found, weakref.ref):
+                found = found()
+                if found is not None:
+                    pending.append(found)
+            elif found is not None:
+                pending.extend(found)
+
+    def take(self, item, ids=None, copy_ids=None):
+        # Copy of item sharing the unchanged entities with earlier
+        # snapshots.  If Id_Tables are given, referenced entities are
+        # given ids in ids, and their copies the same ids in copy_ids.
+        if self not in base._trackers:
+            # Changes are followed from the first snapshot on
+            self.close()
+            base._trackers.append(self)
+        item = _resolve_all(item)
+        self._invalidate()
+        copies = self._copies
+        dependents = self._dependents
+        pending = []
+        parent = None
+        def copy(value):
+            if parent is not None:
+                _add_dependent(dependents, value, parent)
+            entity_copy = copies.get(value)
+            if entity_copy is None:
+                entity_copy = copies[value] = value.__class__.__new__(
+                    value.__class__)
+                pending.append((value, entity_copy))
+            return entity_copy
+        result = _copy_value(item, copy)
+        while pending:
+            entity, entity_copy = pending.pop()
+            parent = entity
+            slots = entity._slots
+            for name in entity._copied_attrs:
+                value = getattr(entity, name)
+                if (isinstance(value, (Anonymous_Elements_Base,
+                                       Named_Elements_Base)) and
+                    value._owner is None):
+                    # So that changes to the elements are reported
+                    value._owner = (entity, name)
+                slots[name].__set__(entity_copy, _copy_value(value, copy))
+        if ids is not None:
+            for entity in Reference_Index(item, ids):
+                copy_ids.define(copies[entity], ids.id(entity))
+            copy_ids.next_id = max(copy_ids.next_id, ids.next_id)
+        return result
@@ -0,0 +1,227 @@
+# Copyright (c) 2020 Jeffrey A. Webb
+
+# Undo and redo.  An Undo_Stack records the value each changed
+# attribute had before a command and the value it had after, for the
+# attributes that are saved or are references.  Element containers are
+# recorded by their contents.  A command is either a single change, or
+# all changes made between begin() and end(), such as those of one
+# mouse drag: changes to the same attribute within it are merged, so a
+# command holds one old and one new value per attribute however many
+# times it was set.  Mouse gestures start with begin_gesture(), which
+# ends a command left open by a lost mouse release.  Undoing or redoing
+# a command assigns its values through the attributes, so trackers see
+# all of them in one batch.
+
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+from . import base
+from .base import Anonymous_Elements_Base, Named_Elements_Base
+from .changes import _own
+
+class _Contents:
+    # An element container and the elements it held
+    __slots__ = ("container", "items")
+
+    def __init__(self, container):
+        self.container = container
+        self.items = tuple(container.items()
+                           if isinstance(container, OrderedDict)
+                           else container)
+
+    def __eq__(self, other):
+        return (isinstance(other, _Contents) and
+                other.container is self.container and
+                len(other.items) == len(self.items) and
+                all(a is b or a == b for a, b in zip(other.items, self.items)))
+
+    def __len__(self):
+        return len(self.items)
+
+    def restore(self, entity, name):
+        container = self.container
+        if getattr(entity, name) is not container:
+            setattr(entity, name, container)
+        if isinstance(container, Anonymous_Elements_Base):
+            if _Contents(container) != self:
+                container[:] = self.items
+        elif _Contents(container) != self:
+            container.clear()
+            for key, value in self.items:
+                container[key] = value
+
+def _value(entity, name):
+    value = getattr(entity, name)
+    if isinstance(value, (Anonymous_Elements_Base, Named_Elements_Base)):
+        return _Contents(value)
+    return value
+
+def _size(value):
+    return len(value) if isinstance(value, _Contents) else 1
+
+def _assign(entity, name, value):
+    if isinstance(value, _Contents):
+        value.restore(entity, name)
+    else:
+        setattr(entity, name, value)
+
+class Undo_Stack:
+    def __init__(self, limit=100000):
+        self.limit = limit # Values kept, counting container elements
+        self._undo = deque() # (label, {(entity, name): (old, new)}, size)
+        self._redo = []
+        self._open = None # {(entity, name): old} of the current command
+        self._label = None
+        self._depth = 0
+        self._size = 0
+        self._applying = False
+
+    def attach(self, entities=()):
+        # Starts recording changes, including those to the element
+        # containers of entities
+        _own(entities)
+        if self not in base._recorders:
+            base._recorders.append(self)
+        if self not in base._trackers:
+            base._trackers.append(self)
+
+    def close(self):
+        if self in base._recorders:
+            base._recorders.remove(self)
+        if self in base._trackers:
+            base._trackers.remove(self)
+        self.clear()
+
+    def clear(self):
+        self._undo = deque()
+        self._redo = []
+        self._open = None
+        self._depth = 0
+        self._size = 0
+
+    def can_undo(self):
+        return bool(self._undo)
+
+    def can_redo(self):
+        return bool(self._redo)
+
+    def undo_label(self):
+        return self._undo[-1][0] if self._undo else None
+
+    def redo_label(self):
+        return self._redo[-1][0] if self._redo else None
+
+    def begin(self, label=None):
+        # Starts a command that lasts until the matching end()
+        if self._depth == 0:
+            self._commit()
+            self._open = {}
+            self._label = label
+        self._depth += 1
+
+    def end(self):
+        if self._depth == 0:
+            return
+        self._depth -= 1
+        if self._depth == 0:
+            self._commit()
+
+    def finish(self):
+        # Ends the current command however many begin() calls are open
+        self._depth = 0
+        self._commit()
+
+    def begin_gesture(self, label=None):
+        # Gestures do not nest, so the command of one whose end() was
+        # lost, such as by releasing the mouse outside the window, is
+        # ended first
+        self.finish()
+        self.begin(label)
+
+    @contextmanager
+    def command(self, label=None):
+        self.begin(label)
+        try:
+            yield self
+        finally:
+            self.end()
+
+    @contextmanager
+    def ignoring(self):
+        # Changes made inside are not recorded, such as those made
+        # while setting up a view of the model
+        applying = self._applying
+        self._applying = True
+        try:
+            yield self
+        finally:
+            self._applying = applying
+
+    def _changing(self, entity, key):
+        if self._applying:
+            return
+        a = entity._attr_info[key]
+        if a.save is False and a.reference is not True:
+            return
+        if self._open is None:
+            self._open = {}
+            self._label = None
+        changed = (entity, a.name)
+        if changed not in self._open:
+            self._open[changed] = _value(entity, a.name)
+
+    def _changed(self, entity, key):
+        if self._depth == 0 and self._open and not self._applying:
+            self._commit()
+
+    def _commit(self):
+        opened = self._open
+        self._open = None
+        if not opened:
+            return
+        changes = {}
+        size = 0
+        for (entity, name), old in opened.items():
+            new = _value(entity, name)
+            if new != old:
+                changes[entity, name] = (old, new)
+                size += _size(old) + _size(new)
+                if name in entity._nested_attrs:
+                    # Changes to entities added to the model are recorded
+                    value = getattr(entity, name)
+                    _own(value.values() if isinstance(value, OrderedDict)
+                         else [value])
+        if not changes:
+            return
+        self._undo.append((self._label, changes, size))
+        self._size += size
+        for command in self._redo:
+            self._size -= command[2]
+        self._redo = []
+        while self._size > self.limit and len(self._undo) > 1:
+            self._size -= self._undo.popleft()[2]
+
+    def _apply(self, changes, index):
+        with self.ignoring():
+            for (entity, name), values in changes.items():
+                _assign(entity, name, values[index])
+
+    def undo(self):
+        # Returns the changed entities and attribute names, or None if
+        # there was nothing to undo
+        self.finish()
+        if not self._undo:
+            return None
+        command = self._undo.pop()
+        self._apply(command[1], 0)
+        self._redo.append(command)
+        return list(command[1])
+
+    def redo(self):
+        self.finish()
+        if not self._redo:
+            return None
+        command = self._redo.pop()
+        self._apply(command[1], 1)
+        self._undo.append(command)
+        return list(command[1])